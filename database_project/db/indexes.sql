@@ -0,0 +1,7 @@
+-- Indexes for the paged lists (ORDER BY created_at DESC, id DESC) on databases
+-- created from an older schema.sql. Run once; schema.sql already contains them.
+CREATE INDEX idx_customers_created ON customers (created_at, id);
+CREATE INDEX idx_categories_created ON categories (created_at, id);
+CREATE INDEX idx_products_created ON products (created_at, id);
+CREATE INDEX idx_orders_created ON orders (created_at, id);
+CREATE INDEX idx_orders_customer_created ON orders (customer_id, created_at, id);
@@ -7,7 +7,8 @@ CREATE TABLE IF NOT EXISTS customers (
   email VARCHAR(255) NOT NULL UNIQUE,
   credit FLOAT NOT NULL DEFAULT 0.0,
   is_active BOOLEAN NOT NULL DEFAULT TRUE,
-  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_customers_created (created_at, id)
 ) ENGINE=InnoDB;
 
 -- Categories
@@ -15,7 +16,8 @@ CREATE TABLE IF NOT EXISTS categories (
   id INT AUTO_INCREMENT PRIMARY KEY,
   name VARCHAR(100) NOT NULL UNIQUE,
   is_active BOOLEAN NOT NULL DEFAULT TRUE,
-  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_categories_created (created_at, id)
 ) ENGINE=InnoDB;
 
 -- Products
@@ -25,7 +27,8 @@ CREATE TABLE IF NOT EXISTS products (
   price FLOAT NOT NULL,
   stock INT NOT NULL DEFAULT 0,
   is_active BOOLEAN NOT NULL DEFAULT TRUE,
-  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+  created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_products_created (created_at, id)
 ) ENGINE=InnoDB;
 
 -- M:N product_categories
@@ -47,6 +50,8 @@ CREATE TABLE IF NOT EXISTS orders (
   total_amount FLOAT NOT NULL DEFAULT 0.0,
   is_paid BOOLEAN NOT NULL DEFAULT FALSE,
   created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  INDEX idx_orders_created (created_at, id),
+  INDEX idx_orders_customer_created (customer_id, created_at, id),
   CONSTRAINT fk_orders_customer FOREIGN KEY (customer_id) REFERENCES customers(id)
 ) ENGINE=InnoDB;
 
@@ -81,4 +86,29 @@ SELECT
   COALESCE(SUM(oi.line_total), 0) AS total_revenue
 FROM products p
 LEFT JOIN order_items oi ON oi.product_id = p.id
-GROUP BY p.id, p.name;
\ No newline at end of file
+GROUP BY p.id, p.name;
+
+-- Summary tables for /report, kept up to date by OrderService.create_order_transaction.
+-- They hold the aggregates of the views above; `python -m src.summary verify|rebuild` checks and repairs them.
+CREATE TABLE IF NOT EXISTS summary_customer_totals (
+  customer_id INT PRIMARY KEY,
+  orders_count INT NOT NULL DEFAULT 0,
+  total_spent DOUBLE NOT NULL DEFAULT 0,
+  CONSTRAINT fk_sct_customer FOREIGN KEY (customer_id) REFERENCES customers(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+CREATE TABLE IF NOT EXISTS summary_product_sales (
+  product_id INT PRIMARY KEY,
+  total_quantity_sold INT NOT NULL DEFAULT 0,
+  total_revenue DOUBLE NOT NULL DEFAULT 0,
+  CONSTRAINT fk_sps_product FOREIGN KEY (product_id) REFERENCES products(id) ON DELETE CASCADE
+) ENGINE=InnoDB;
+
+-- Single row (id = 1)
+CREATE TABLE IF NOT EXISTS summary_overall (
+  id TINYINT PRIMARY KEY,
+  orders_count INT NOT NULL DEFAULT 0,
+  total_revenue DOUBLE NOT NULL DEFAULT 0,
+  min_order_total DOUBLE NOT NULL DEFAULT 0,
+  max_order_total DOUBLE NOT NULL DEFAULT 0
+) ENGINE=InnoDB;
@@ -1,4 +1,4 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, Request, render_template, request, redirect, url_for, flash
 from datetime import date
 import os
 import io
@@ -7,27 +7,31 @@ import io
 try:
     # running as a module: python -m src.app
     from .config import load_config, ConfigError
-    from .db import get_connection, DBError
+    from .db import get_pool, DBError
     from .repositories.customer import CustomerRepository
     from .repositories.product import ProductRepository
     from .repositories.category import CategoryRepository
     from .repositories.order import OrderRepository
+    from .repositories.pagination import page_size, decode_cursor
+    from .repositories.summary import SummaryRepository
     from .services.order_service import OrderService, OrderServiceError
-    from .importers.csv_importer import import_customers_csv, CSVImporterError
-    from .importers.json_importer import import_products_json, JSONImporterError
+    from .importers.csv_importer import import_customers_csv_bulk, CSVImporterError
+    from .importers.json_importer import import_products_json_stream, JSONImporterError
 except ImportError:
     # running as a script: python src/app.py (not recommended)
     import sys
     sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # add project root to sys.path
     from .config import load_config, ConfigError
-    from .db import get_connection, DBError
+    from .db import get_pool, DBError
     from .repositories.customer import CustomerRepository
     from .repositories.product import ProductRepository
     from .repositories.category import CategoryRepository
     from .repositories.order import OrderRepository
+    from .repositories.pagination import page_size, decode_cursor
+    from .repositories.summary import SummaryRepository
     from .services.order_service import OrderService, OrderServiceError
-    from .importers.csv_importer import import_customers_csv, CSVImporterError
-    from .importers.json_importer import import_products_json, JSONImporterError
+    from .importers.csv_importer import import_customers_csv_bulk, CSVImporterError
+    from .importers.json_importer import import_products_json_stream, JSONImporterError
 # --- end import bootstrap ---
 
 cfg = None
@@ -47,9 +51,31 @@ app = Flask(__name__, static_folder="static", template_folder="templates")
 app.secret_key = cfg["app"]["secret_key"]
 app.config["MAX_CONTENT_LENGTH"] = cfg["app"]["max_upload_size_mb"] * 1024 * 1024
 
+# The importers stream their upload (Werkzeug spools it to a temp file), so they get their own limit.
+IMPORT_ENDPOINTS = ("import_customers", "import_products")
+
+class UploadRequest(Request):
+    @property
+    def max_content_length(self):
+        if self.endpoint in IMPORT_ENDPOINTS:
+            return cfg["app"]["max_import_size_mb"] * 1024 * 1024
+        return super().max_content_length
+
+app.request_class = UploadRequest
+
+# Rows of each list on the overview page, the list pages take ?limit= (see pagination.page_size).
+HOME_PAGE_SIZE = 10
+
+# Per-row import messages shown after an import, the summary counts all of them.
+MAX_FLASHED_IMPORT_ERRORS = 20
+
 def with_conn(fn):
     def wrapper(*args, **kwargs):
-        conn = get_connection()
+        pool = get_pool()
+        try:
+            conn = pool.acquire()
+        except DBError as e:
+            return render_template("error.html", message=f"Database error: {str(e)}")
         try:
             result = fn(conn, *args, **kwargs)
             return result
@@ -57,42 +83,61 @@ def with_conn(fn):
             conn.rollback()
             return render_template("error.html", message=f"Database error: {str(e)}")
         finally:
-            conn.close()
+            pool.release(conn)
     wrapper.__name__ = fn.__name__
     return wrapper
 
+def page_args(cursor_arg="after"):
+    """(limit, cursor) of a list page from the query string; a broken cursor falls back to the first page."""
+    cursor = request.args.get(cursor_arg) or None
+    try:
+        decode_cursor(cursor)
+    except ValueError:
+        flash("Invalid page cursor, showing the first page.", "error")
+        cursor = None
+    return page_size(request.args.get("limit")), cursor
+
 @app.route("/")
 @with_conn
 def index(conn):
     cust_repo = CustomerRepository(conn)
     prod_repo = ProductRepository(conn)
     order_repo = OrderRepository(conn)
-    customers = cust_repo.list_all()
-    products = prod_repo.list_all()
-    orders = order_repo.list_all()
+    customers = cust_repo.list_page(HOME_PAGE_SIZE).items
+    products = prod_repo.list_page(HOME_PAGE_SIZE).items
+    orders = order_repo.list_page(HOME_PAGE_SIZE).items
     return render_template("index.html", customers=customers, products=products, orders=orders)
 
 @app.route("/customers")
 @with_conn
 def customers(conn):
     cust_repo = CustomerRepository(conn)
-    return render_template("customers.html", customers=cust_repo.list_all())
+    limit, cursor = page_args()
+    page = cust_repo.list_page(limit, cursor)
+    return render_template("customers.html", customers=page.items, next_cursor=page.next_cursor, limit=limit,
+                           on_duplicate=cfg["app"]["import_on_duplicate"])
 
 @app.route("/products")
 @with_conn
 def products(conn):
     prod_repo = ProductRepository(conn)
     cat_repo = CategoryRepository(conn)
-    products = prod_repo.list_all()
-    categories = cat_repo.list_all()
-    return render_template("products.html", products=products, categories=categories)
+    limit, cursor = page_args()
+    _, cat_cursor = page_args("cat_after")
+    page = prod_repo.list_page(limit, cursor)
+    cat_page = cat_repo.list_page(limit, cat_cursor)
+    return render_template("products.html", products=page.items, next_cursor=page.next_cursor, limit=limit,
+                           categories=cat_page.items, categories_next_cursor=cat_page.next_cursor)
 
 @app.route("/orders")
 @with_conn
 def orders(conn):
     order_repo = OrderRepository(conn)
-    orders = order_repo.list_all()
-    return render_template("orders.html", orders=orders)
+    limit, cursor = page_args()
+    customer_id = request.args.get("customer_id", type=int)
+    page = order_repo.list_page(limit, cursor, customer_id=customer_id)
+    return render_template("orders.html", orders=page.items, next_cursor=page.next_cursor, limit=limit,
+                           customer_id=customer_id)
 
 @app.route("/orders/<int:order_id>")
 @with_conn
@@ -144,31 +189,12 @@ def order_new(conn):
 @app.route("/report")
 @with_conn
 def report(conn):
-    # Aggregated report using views and joins across multiple tables
-    cur1 = conn.cursor()
-    cur1.execute("SELECT * FROM view_customer_order_totals ORDER BY total_spent DESC")
-    customer_totals = cur1.fetchall()
-
-    cur2 = conn.cursor()
-    cur2.execute("SELECT * FROM view_product_sales ORDER BY total_revenue DESC")
-    product_sales = cur2.fetchall()
-
-    # Additional cross-table aggregates: min/max/avg
-    cur3 = conn.cursor()
-    cur3.execute("""
-        SELECT
-          COUNT(DISTINCT o.id) AS orders_count,
-          COALESCE(SUM(o.total_amount), 0) AS total_revenue,
-          COALESCE(MIN(o.total_amount), 0) AS min_order_total,
-          COALESCE(MAX(o.total_amount), 0) AS max_order_total
-        FROM orders o
-    """)
-    overall = cur3.fetchone()
-
+    # Aggregates are maintained in summary tables by OrderService (see SummaryRepository)
+    summary_repo = SummaryRepository(conn)
     return render_template("report.html",
-                           customer_totals=customer_totals,
-                           product_sales=product_sales,
-                           overall=overall)
+                           customer_totals=summary_repo.customer_totals(),
+                           product_sales=summary_repo.product_sales(),
+                           overall=summary_repo.overall())
 
 @app.route("/import/customers", methods=["POST"])
 @with_conn
@@ -182,9 +208,14 @@ def import_customers(conn):
         return redirect(url_for("customers"))
     try:
         # Proper text stream for csv.DictReader
-        text_stream = io.TextIOWrapper(file.stream, encoding="utf-8")
-        count = import_customers_csv(conn, text_stream)
-        flash(f"Imported {count} customers.", "success")
+        text_stream = io.TextIOWrapper(file.stream, encoding="utf-8", newline="")
+        report = import_customers_csv_bulk(conn, text_stream,
+                                           batch_size=cfg["app"]["import_batch_size"],
+                                           commit_every=cfg["app"]["import_commit_every"],
+                                           on_duplicate=request.form.get("on_duplicate") or cfg["app"]["import_on_duplicate"])
+        flash(report.summary(), "error" if report.failed else "success")
+        for line, message in report.errors[:MAX_FLASHED_IMPORT_ERRORS]:
+            flash(f"Line {line}: {message}", "error")
     except CSVImporterError as e:
         flash(str(e), "error")
     return redirect(url_for("customers"))
@@ -200,8 +231,16 @@ def import_products(conn):
         flash("Please upload a JSON file.", "error")
         return redirect(url_for("products"))
     try:
-        count = import_products_json(conn, file.stream)
-        flash(f"Imported {count} products.", "success")
+        text_stream = io.TextIOWrapper(file.stream, encoding="utf-8")
+        report = import_products_json_stream(conn, text_stream,
+                                             batch_size=cfg["app"]["import_batch_size"],
+                                             commit_every=cfg["app"]["import_commit_every"],
+                                             progress=lambda offset, r: app.logger.info(
+                                                 "product import: offset %d, %d inserted, %d errors",
+                                                 offset, r.inserted, r.failed))
+        flash(report.summary(), "error" if report.failed else "success")
+        for offset, message in report.errors[:MAX_FLASHED_IMPORT_ERRORS]:
+            flash(f"Item {offset}: {message}", "error")
     except JSONImporterError as e:
         flash(str(e), "error")
     return redirect(url_for("products"))
@@ -19,9 +19,26 @@ def load_config():
     for key in required_db:
         if key not in db:
             raise ConfigError(f"Missing database.{key} in config.")
+    pool = db.get("pool") or {}
+    db["pool"] = pool
+    pool.setdefault("min_size", 2)
+    pool.setdefault("max_size", 10)
+    pool.setdefault("checkout_timeout_sec", 5.0)
+    pool.setdefault("recycle_sec", 1800)
+    pool.setdefault("ping_on_checkout", True)
+    if int(pool["max_size"]) < 1 or not 0 <= int(pool["min_size"]) <= int(pool["max_size"]):
+        raise ConfigError("database.pool needs 0 <= min_size <= max_size and max_size >= 1.")
     if "secret_key" not in app:
         raise ConfigError("Missing app.secret_key in config.")
     app.setdefault("debug", False)
     app.setdefault("allowed_import_formats", ["csv", "json"])
     app.setdefault("max_upload_size_mb", 5)
+    app.setdefault("max_import_size_mb", 1024)
+    app.setdefault("import_batch_size", 1000)
+    app.setdefault("import_commit_every", 10000)
+    app.setdefault("import_on_duplicate", "skip")
+    if int(app["import_batch_size"]) < 1 or int(app["import_commit_every"]) < 1:
+        raise ConfigError("app.import_batch_size and app.import_commit_every must be >= 1.")
+    if app["import_on_duplicate"] not in ("skip", "update"):
+        raise ConfigError("app.import_on_duplicate must be 'skip' or 'update'.")
     return data
\ No newline at end of file
@@ -1,3 +1,5 @@
+import threading
+import time
 import pymysql
 from .config import load_config
 
@@ -25,4 +27,147 @@ def execute_query(conn, sql, params=None):
             cur.execute(sql, params or ())
             return cur
     except Exception as e:
-        raise DBError(str(e))
\ No newline at end of file
+        raise DBError(str(e))
+
+def execute_many(conn, sql, rows):
+    """executemany: PyMySQL sends an INSERT ... VALUES as one multi-row statement."""
+    try:
+        with conn.cursor() as cur:
+            cur.executemany(sql, rows)
+            return cur
+    except Exception as e:
+        raise DBError(str(e))
+
+class ConnectionPool:
+    """
+    Thread-safe pool of open connections.
+    acquire() reuses an idle connection (newest first) or opens a new one up to max_size,
+    otherwise waits up to checkout_timeout_sec. Connections older than recycle_sec are
+    replaced, idle ones are pinged before reuse when ping_on_checkout is set.
+    """
+
+    def __init__(self, connect, min_size: int, max_size: int, checkout_timeout_sec: float,
+                 recycle_sec: float, ping_on_checkout: bool):
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.checkout_timeout_sec = checkout_timeout_sec
+        self.recycle_sec = recycle_sec
+        self.ping_on_checkout = ping_on_checkout
+        self._cond = threading.Condition()
+        self._idle = []      # [(conn, created_at)], last released at the end
+        self._created = {}   # id(conn) -> created_at of every open pooled connection
+        self._size = 0       # open + being opened
+        self._filled = False
+
+    def _open(self):
+        """Opens a connection for a slot already counted in _size."""
+        try:
+            conn = self._connect()
+        except Exception as e:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise DBError(f"Cannot connect to database: {str(e)}")
+        with self._cond:
+            self._created[id(conn)] = time.monotonic()
+        return conn
+
+    def _discard(self, conn):
+        with self._cond:
+            if self._created.pop(id(conn), None) is not None:
+                self._size -= 1
+                self._cond.notify()
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _fill(self):
+        # Best effort: a database that is down must not break the first request more than necessary.
+        opened = []
+        try:
+            while True:
+                with self._cond:
+                    if self._size >= self.min_size:
+                        break
+                    self._size += 1
+                opened.append(self._open())
+        except DBError:
+            pass
+        for conn in opened:
+            self.release(conn)
+
+    def _usable(self, conn, created_at) -> bool:
+        if time.monotonic() - created_at > self.recycle_sec:
+            return False
+        if self.ping_on_checkout:
+            try:
+                conn.ping(reconnect=False)
+            except Exception:
+                return False
+        return True
+
+    def acquire(self):
+        if not self._filled:
+            self._filled = True
+            self._fill()
+        deadline = time.monotonic() + self.checkout_timeout_sec
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise DBError("Connection pool exhausted, try again later.")
+                    self._cond.wait(remaining)
+                if self._idle:
+                    conn, created_at = self._idle.pop()
+                else:
+                    self._size += 1
+                    conn = None
+            if conn is None:
+                return self._open()
+            if self._usable(conn, created_at):
+                return conn
+            self._discard(conn)
+
+    def release(self, conn):
+        """Returns a connection. Whatever it left uncommitted is rolled back first."""
+        try:
+            # Also ends the read snapshot of a request that only ran SELECTs (autocommit is off).
+            conn.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        with self._cond:
+            created_at = self._created.get(id(conn))
+            if created_at is not None:
+                self._idle.append((conn, created_at))
+                self._cond.notify()
+                return
+        # Not opened by this pool.
+        conn.close()
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._discard(conn)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            pool_cfg = _db["pool"]
+            _pool = ConnectionPool(
+                get_connection,
+                min_size=int(pool_cfg["min_size"]),
+                max_size=int(pool_cfg["max_size"]),
+                checkout_timeout_sec=float(pool_cfg["checkout_timeout_sec"]),
+                recycle_sec=float(pool_cfg["recycle_sec"]),
+                ping_on_checkout=bool(pool_cfg["ping_on_checkout"]),
+            )
+        return _pool
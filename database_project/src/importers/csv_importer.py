@@ -1,27 +1,127 @@
 import csv
-from typing import IO
-from ..db import execute_query
+from typing import IO, Dict, Tuple
+from ..db import DBError, execute_query, execute_many
+from .report import ImportReport
 
 class CSVImporterError(Exception):
     pass
 
-def import_customers_csv(conn, file_obj: IO[str]) -> int:
+DUPLICATE_MODES = ("skip", "update")
+
+_INSERT_CUSTOMERS = "INSERT INTO customers (name, email, credit, is_active) VALUES (%s, %s, %s, %s)"
+_UPSERT_CUSTOMERS = (_INSERT_CUSTOMERS +
+    " ON DUPLICATE KEY UPDATE name=VALUES(name), credit=VALUES(credit), is_active=VALUES(is_active)")
+
+def _parse_customer(row: Dict) -> Tuple:
+    """Validated (name, email, credit, is_active) of one CSV row, ValueError with the reason otherwise."""
+    name = (row.get("name") or "").strip()
+    email = (row.get("email") or "").strip()
+    if not name or not email:
+        raise ValueError("Missing name or email.")
+    if len(name) > 100 or len(email) > 255:
+        raise ValueError("Name or email too long.")
+    if "@" not in email:
+        raise ValueError(f"Invalid email '{email}'.")
+    try:
+        credit = float(row.get("credit") or 0)
+    except ValueError:
+        raise ValueError(f"Invalid credit '{row.get('credit')}'.")
+    is_active = (row.get("is_active") or "true").strip().lower()
+    if is_active not in ("true", "1", "yes", "false", "0", "no"):
+        raise ValueError(f"Invalid is_active '{is_active}'.")
+    return name, email, credit, is_active in ("true", "1", "yes")
+
+def _write_batch(conn, batch: Dict, on_duplicate: str, report: ImportReport) -> None:
+    """batch: lowercased email -> (line, values). Emails are unique within the batch."""
+    emails = [values[1] for _, values in batch.values()]
+    cur = execute_query(conn,
+        f"SELECT email FROM customers WHERE email IN ({', '.join(['%s'] * len(emails))})",
+        emails)
+    existing = {r["email"].lower() for r in cur.fetchall()}
+
+    rows = []
+    for key, (line, values) in batch.items():
+        if key in existing and on_duplicate == "skip":
+            report.add_skipped(line, f"Email {values[1]} already exists, skipped.")
+            continue
+        rows.append((line, values, key in existing))
+    if not rows:
+        return
+
+    sql = _UPSERT_CUSTOMERS if on_duplicate == "update" else _INSERT_CUSTOMERS
+    execute_query(conn, "SAVEPOINT customer_batch")
+    try:
+        execute_many(conn, sql, [values for _, values, _ in rows])
+        written = rows
+    except DBError:
+        # Undo the batch and write it row by row, so only the offending rows are reported.
+        execute_query(conn, "ROLLBACK TO SAVEPOINT customer_batch")
+        written = []
+        for line, values, is_update in rows:
+            try:
+                execute_query(conn, sql, values)
+                written.append((line, values, is_update))
+            except DBError as e:
+                report.add_error(line, str(e))
+    for _, _, is_update in written:
+        if is_update:
+            report.updated += 1
+        else:
+            report.inserted += 1
+
+def import_customers_csv_bulk(conn, file_obj: IO[str], batch_size: int = 1000, commit_every: int = 10000,
+                              on_duplicate: str = "skip") -> ImportReport:
     """
-    Expected CSV header: name,email,credit,is_active
-    Returns number of imported rows.
+    Streaming import for large files. Expected CSV header: name,email,credit,is_active
+    Rows are validated one by one, written as multi-row INSERTs of batch_size rows and
+    committed every commit_every rows; invalid rows are reported and the import goes on.
+    on_duplicate: "skip" keeps existing customers, "update" overwrites them (email is the key).
     """
+    if on_duplicate not in DUPLICATE_MODES:
+        raise CSVImporterError(f"on_duplicate must be one of {', '.join(DUPLICATE_MODES)}.")
     reader = csv.DictReader(file_obj)
-    count = 0
-    for row in reader:
-        name = row.get("name", "").strip()
-        email = row.get("email", "").strip()
-        credit = float(row.get("credit", "0") or 0)
-        is_active = row.get("is_active", "true").lower() in ("true", "1", "yes")
-        if not name or not email:
-            raise CSVImporterError("Missing name or email in CSV row.")
-        execute_query(conn,
-            "INSERT INTO customers (name, email, credit, is_active) VALUES (%s, %s, %s, %s)",
-            (name, email, credit, is_active))
-        count += 1
-    conn.commit()
-    return count
\ No newline at end of file
+    try:
+        fieldnames = reader.fieldnames  # reads and parses the first line
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise CSVImporterError(f"Import stopped: {str(e)}. Cannot read the CSV header, nothing was saved.")
+    if not fieldnames:
+        raise CSVImporterError("CSV header must contain at least name,email.")
+    # Rows are keyed by these names, so "name, email" must become "name", "email" before reading them.
+    reader.fieldnames = [f.strip() for f in fieldnames]
+    if not {"name", "email"} <= set(reader.fieldnames):
+        raise CSVImporterError("CSV header must contain at least name,email.")
+
+    report = ImportReport()
+    batch: Dict = {}
+    uncommitted = 0
+    committed_line = 1
+    try:
+        for row in reader:
+            line = reader.line_num
+            try:
+                values = _parse_customer(row)
+            except ValueError as e:
+                report.add_error(line, str(e))
+                continue
+            key = values[1].lower()
+            if key in batch:
+                if on_duplicate == "skip":
+                    report.add_skipped(line, f"Email {values[1]} repeats in the file, skipped.")
+                    continue
+                report.add_skipped(batch[key][0], f"Email {values[1]} is updated again on line {line}.")
+            batch[key] = (line, values)
+            if len(batch) >= batch_size:
+                _write_batch(conn, batch, on_duplicate, report)
+                uncommitted += len(batch)
+                batch = {}
+                if uncommitted >= commit_every:
+                    conn.commit()
+                    uncommitted = 0
+                    committed_line = line
+        if batch:
+            _write_batch(conn, batch, on_duplicate, report)
+        conn.commit()
+    except (DBError, csv.Error, UnicodeDecodeError) as e:
+        conn.rollback()
+        raise CSVImporterError(f"Import stopped: {str(e)}. Rows up to line {committed_line} were saved.")
+    return report
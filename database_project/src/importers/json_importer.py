@@ -1,32 +1,161 @@
 import json
-from typing import IO
-from ..db import execute_query
+from typing import IO, Callable, Iterator, List, Optional, Tuple
+from ..db import DBError, execute_query, execute_many
+from .report import ImportReport
 
 class JSONImporterError(Exception):
     pass
 
-def import_products_json(conn, file_obj: IO[str]) -> int:
+# One array item may not be larger than this (bounds the parser buffer).
+MAX_ITEM_CHARS = 1024 * 1024
+
+_INSERT_PRODUCTS = "INSERT INTO products (name, price, stock, is_active) VALUES (%s, %s, %s, %s)"
+
+def iter_json_array(file_obj: IO[str], chunk_size: int = 64 * 1024) -> Iterator[Tuple[int, object]]:
+    """
+    Yields (offset, item) of a top-level JSON array, reading file_obj chunk by chunk.
+    Memory stays at about one item plus one chunk, whatever the size of the array.
+    """
+    decoder = json.JSONDecoder()
+    buf = ""
+    pos = 0
+    eof = False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = file_obj.read(chunk_size)
+        if not chunk:
+            eof = True
+            return False
+        buf = buf[pos:] + chunk
+        pos = 0
+        return True
+
+    def next_char() -> str:
+        """First non-whitespace character from pos on ("" at the end of input)."""
+        nonlocal pos
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n":
+                pos += 1
+            if pos < len(buf):
+                return buf[pos]
+            if not more():
+                return ""
+
+    def close_array() -> None:
+        nonlocal pos
+        pos += 1
+        if next_char():
+            raise JSONImporterError("Invalid JSON: unexpected data after the closing ']'.")
+
+    if next_char() != "[":
+        raise JSONImporterError("JSON must be an array of products.")
+    pos += 1
+    if next_char() == "]":
+        close_array()
+        return
+
+    offset = 0
+    while True:
+        if not next_char():
+            raise JSONImporterError(f"Invalid JSON: unexpected end of file in item {offset}.")
+        while True:
+            if len(buf) - pos > MAX_ITEM_CHARS:
+                raise JSONImporterError(f"Item {offset} is larger than {MAX_ITEM_CHARS} characters.")
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError as e:
+                if not more():
+                    raise JSONImporterError(f"Invalid JSON in item {offset}: {e.msg}.")
+                continue
+            # Only a visible ',' or ']' proves the value is complete: "2.5e" may continue as "2.5e3".
+            follow = end
+            while follow < len(buf) and buf[follow] in " \t\r\n":
+                follow += 1
+            if (follow < len(buf) and buf[follow] in ",]") or not more():
+                break
+        pos = end
+        yield offset, item
+        offset += 1
+
+        sep = next_char()
+        if sep == "]":
+            close_array()
+            return
+        if sep != ",":
+            raise JSONImporterError(f"Invalid JSON after item {offset - 1}: expected ',' or ']'.")
+        pos += 1
+
+def _parse_product(item) -> Tuple:
+    """Validated (name, price, stock, is_active) of one item, ValueError with the reason otherwise."""
+    if not isinstance(item, dict):
+        raise ValueError("Item is not an object.")
+    name = str(item.get("name", "")).strip()
+    if not name or len(name) > 150:
+        raise ValueError("Missing or too long name.")
+    try:
+        price = float(item.get("price", 0))
+        stock = int(item.get("stock", 0))
+    except (TypeError, ValueError):
+        raise ValueError("Price or stock is not a number.")
+    if price <= 0 or stock < 0:
+        raise ValueError("Price must be > 0 and stock >= 0.")
+    return name, price, stock, bool(item.get("is_active", True))
+
+def _write_products(conn, rows: List[Tuple[int, Tuple]], report: ImportReport) -> None:
+    execute_query(conn, "SAVEPOINT product_batch")
+    try:
+        execute_many(conn, _INSERT_PRODUCTS, [values for _, values in rows])
+        report.inserted += len(rows)
+    except DBError:
+        # Undo the batch and write it item by item, so only the offending items are reported.
+        execute_query(conn, "ROLLBACK TO SAVEPOINT product_batch")
+        for offset, values in rows:
+            try:
+                execute_query(conn, _INSERT_PRODUCTS, values)
+                report.inserted += 1
+            except DBError as e:
+                report.add_error(offset, str(e))
+
+def import_products_json_stream(conn, file_obj: IO[str], batch_size: int = 1000, commit_every: int = 10000,
+                                progress: Optional[Callable[[int, ImportReport], None]] = None) -> ImportReport:
     """
+    Streaming import for large catalogs.
     Expected JSON: [{ "name": "...", "price": 12.3, "stock": 10, "is_active": true }, ...]
-    Returns number of imported products.
+    Items are parsed one at a time, inserted in batches of batch_size and committed every
+    commit_every items; invalid items are reported by their offset in the array and skipped.
+    progress(offset, report) is called after every written batch.
     """
+    report = ImportReport()
+    rows: List[Tuple[int, Tuple]] = []
+    uncommitted = 0
+    committed_offset = -1
+    offset = -1
     try:
-        data = json.load(file_obj)
-        if not isinstance(data, list):
-            raise JSONImporterError("JSON must be an array of products.")
-        count = 0
-        for item in data:
-            name = str(item.get("name", "")).strip()
-            price = float(item.get("price", 0))
-            stock = int(item.get("stock", 0))
-            is_active = bool(item.get("is_active", True))
-            if not name or price <= 0 or stock < 0:
-                raise JSONImporterError("Invalid product entry.")
-            execute_query(conn,
-                "INSERT INTO products (name, price, stock, is_active) VALUES (%s, %s, %s, %s)",
-                (name, price, stock, is_active))
-            count += 1
+        for offset, item in iter_json_array(file_obj):
+            try:
+                rows.append((offset, _parse_product(item)))
+            except ValueError as e:
+                report.add_error(offset, str(e))
+                continue
+            if len(rows) >= batch_size:
+                _write_products(conn, rows, report)
+                uncommitted += len(rows)
+                rows = []
+                if uncommitted >= commit_every:
+                    conn.commit()
+                    uncommitted = 0
+                    committed_offset = offset
+                if progress:
+                    progress(offset, report)
+        if rows:
+            _write_products(conn, rows, report)
         conn.commit()
-        return count
-    except json.JSONDecodeError as e:
-        raise JSONImporterError(f"Invalid JSON: {str(e)}")
\ No newline at end of file
+        if progress:
+            progress(offset, report)
+    except (DBError, JSONImporterError, UnicodeDecodeError) as e:
+        conn.rollback()
+        raise JSONImporterError(f"Import stopped: {str(e).rstrip('.')}. Items up to offset {committed_offset} were saved.")
+    return report
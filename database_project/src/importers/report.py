@@ -0,0 +1,32 @@
+from typing import List, Tuple
+
+class ImportReport:
+    """
+    Outcome of a bulk import: counts and per-row messages.
+    row is the CSV line number or the offset of the item in the JSON array.
+    Only the first max_errors messages are kept, the counts cover every row.
+    """
+
+    def __init__(self, max_errors: int = 1000):
+        self.max_errors = max_errors
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.failed = 0
+        self.errors: List[Tuple[int, str]] = []
+
+    def _note(self, row: int, message: str) -> None:
+        if len(self.errors) < self.max_errors:
+            self.errors.append((row, message))
+
+    def add_error(self, row: int, message: str) -> None:
+        self.failed += 1
+        self._note(row, message)
+
+    def add_skipped(self, row: int, message: str) -> None:
+        self.skipped += 1
+        self._note(row, message)
+
+    def summary(self) -> str:
+        return (f"Imported {self.inserted} new, updated {self.updated}, skipped {self.skipped}, "
+                f"{self.failed} rows with errors.")
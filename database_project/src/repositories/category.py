@@ -1,14 +1,18 @@
-from typing import List, Dict
+from typing import Optional, List, Dict
 from ..db import execute_query
+from .pagination import DEFAULT_PAGE_SIZE, Page, fetch_page
 
 class CategoryRepository:
     def __init__(self, conn):
         self.conn = conn
 
     def list_all(self) -> List[Dict]:
-        cur = execute_query(self.conn, "SELECT * FROM categories ORDER BY created_at DESC")
+        cur = execute_query(self.conn, "SELECT * FROM categories ORDER BY created_at DESC, id DESC")
         return cur.fetchall()
 
+    def list_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        return fetch_page(self.conn, "SELECT * FROM categories", limit, cursor)
+
     def assign_to_product(self, product_id: int, category_id: int) -> None:
         execute_query(self.conn,
             "INSERT IGNORE INTO product_categories (product_id, category_id) VALUES (%s, %s)",
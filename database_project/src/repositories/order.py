@@ -1,5 +1,6 @@
 from typing import Optional, List, Dict
 from ..db import execute_query
+from .pagination import DEFAULT_PAGE_SIZE, Page, fetch_page
 
 class OrderRepository:
     def __init__(self, conn):
@@ -11,10 +12,21 @@ class OrderRepository:
             SELECT o.*, c.name AS customer_name
             FROM orders o
             JOIN customers c ON c.id = o.customer_id
-            ORDER BY o.created_at DESC
+            ORDER BY o.created_at DESC, o.id DESC
             """)
         return cur.fetchall()
 
+    def list_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None,
+                  customer_id: Optional[int] = None) -> Page:
+        """Newest orders first; with customer_id only that customer's (index orders(customer_id, created_at))."""
+        conditions, params = [], []
+        if customer_id is not None:
+            conditions.append("o.customer_id = %s")
+            params.append(customer_id)
+        return fetch_page(self.conn,
+            "SELECT o.*, c.name AS customer_name FROM orders o JOIN customers c ON c.id = o.customer_id",
+            limit, cursor, conditions, params, prefix="o.")
+
     def get_by_id(self, order_id: int) -> Optional[Dict]:
         cur = execute_query(self.conn, "SELECT * FROM orders WHERE id=%s", (order_id,))
         return cur.fetchone()
@@ -0,0 +1,54 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+from ..db import execute_query
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+class Page:
+    """One page of a list, newest first. next_cursor is None on the last page."""
+
+    def __init__(self, items: List[Dict], next_cursor: Optional[str]):
+        self.items = items
+        self.next_cursor = next_cursor
+
+def page_size(value) -> int:
+    """Page size from a request argument, clamped to 1..MAX_PAGE_SIZE."""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+def encode_cursor(row: Dict) -> str:
+    return f"{row['created_at']:%Y-%m-%dT%H:%M:%S}_{row['id']}"
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[datetime, int]]:
+    """(created_at, id) of the last row of the previous page, ValueError for a malformed cursor."""
+    if not cursor:
+        return None
+    created_at, _, row_id = cursor.rpartition("_")
+    return datetime.strptime(created_at, "%Y-%m-%dT%H:%M:%S"), int(row_id)
+
+def fetch_page(conn, select_sql: str, limit: int, cursor: Optional[str] = None,
+               conditions: Sequence[str] = (), params: Sequence = (), prefix: str = "") -> Page:
+    """
+    Keyset pagination over (created_at, id) descending: the next page starts right after the
+    last row of the previous one, so every page costs the same index range scan of limit + 1 rows.
+    select_sql has no WHERE/ORDER BY; conditions are ANDed, prefix is the table alias ("o.").
+    """
+    where = list(conditions)
+    args = list(params)
+    after = decode_cursor(cursor)
+    if after:
+        where.append(f"({prefix}created_at < %s OR ({prefix}created_at = %s AND {prefix}id < %s))")
+        args += [after[0], after[0], after[1]]
+    sql = select_sql
+    if where:
+        sql += " WHERE " + " AND ".join(where)
+    sql += f" ORDER BY {prefix}created_at DESC, {prefix}id DESC LIMIT %s"
+    args.append(limit + 1)
+    rows = execute_query(conn, sql, args).fetchall()
+    if len(rows) > limit:
+        return Page(rows[:limit], encode_cursor(rows[limit - 1]))
+    return Page(rows, None)
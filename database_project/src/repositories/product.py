@@ -1,14 +1,18 @@
 from typing import Optional, List, Dict
 from ..db import execute_query
+from .pagination import DEFAULT_PAGE_SIZE, Page, fetch_page
 
 class ProductRepository:
     def __init__(self, conn):
         self.conn = conn
 
     def list_all(self) -> List[Dict]:
-        cur = execute_query(self.conn, "SELECT * FROM products ORDER BY created_at DESC")
+        cur = execute_query(self.conn, "SELECT * FROM products ORDER BY created_at DESC, id DESC")
         return cur.fetchall()
 
+    def list_page(self, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None) -> Page:
+        return fetch_page(self.conn, "SELECT * FROM products", limit, cursor)
+
     def get_by_id(self, product_id: int) -> Optional[Dict]:
         cur = execute_query(self.conn, "SELECT * FROM products WHERE id=%s", (product_id,))
         return cur.fetchone()
@@ -0,0 +1,140 @@
+import struct
+from typing import Dict, List
+from ..db import execute_query, execute_many
+
+# add_order() adds the amounts as stored (see _as_stored), so only the order of the DOUBLE
+# additions differs from the views' SUM().
+TOLERANCE = 0.01
+
+_EMPTY_OVERALL = {"orders_count": 0, "total_revenue": 0.0, "min_order_total": 0.0, "max_order_total": 0.0}
+
+class SummaryRepository:
+    """
+    Report aggregates kept in summary_* tables: add_order() updates them in the caller's
+    transaction, so reading the report no longer scans orders and order_items.
+    The views view_customer_order_totals and view_product_sales stay the source of truth
+    for verify() and rebuild().
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def add_order(self, customer_id: int, total_amount: float, items: List[Dict]) -> None:
+        """items: [{product_id, quantity, line_total}] of the order. Does not commit."""
+        total_amount = _as_stored(total_amount)
+        per_product: Dict[int, List] = {}
+        for it in items:
+            sums = per_product.setdefault(it["product_id"], [0, 0.0])
+            sums[0] += it["quantity"]
+            sums[1] += _as_stored(it["line_total"])
+        # Rows are locked in id order (products sorted, then the single overall row) to avoid deadlocks.
+        execute_query(self.conn, """
+            INSERT INTO summary_customer_totals (customer_id, orders_count, total_spent) VALUES (%s, 1, %s)
+            ON DUPLICATE KEY UPDATE orders_count = orders_count + 1, total_spent = total_spent + VALUES(total_spent)
+            """, (customer_id, total_amount))
+        execute_many(self.conn, """
+            INSERT INTO summary_product_sales (product_id, total_quantity_sold, total_revenue) VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE total_quantity_sold = total_quantity_sold + VALUES(total_quantity_sold),
+                                    total_revenue = total_revenue + VALUES(total_revenue)
+            """, [(pid, qty, revenue) for pid, (qty, revenue) in sorted(per_product.items())])
+        # MySQL applies the assignments left to right, so min/max still see the old orders_count.
+        execute_query(self.conn, """
+            INSERT INTO summary_overall (id, orders_count, total_revenue, min_order_total, max_order_total)
+            VALUES (1, 1, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+              min_order_total = IF(orders_count = 0, VALUES(min_order_total), LEAST(min_order_total, VALUES(min_order_total))),
+              max_order_total = IF(orders_count = 0, VALUES(max_order_total), GREATEST(max_order_total, VALUES(max_order_total))),
+              orders_count = orders_count + 1,
+              total_revenue = total_revenue + VALUES(total_revenue)
+            """, (total_amount, total_amount, total_amount))
+
+    def customer_totals(self) -> List[Dict]:
+        cur = execute_query(self.conn, """
+            SELECT c.id AS customer_id, c.name AS customer_name,
+                   COALESCE(s.orders_count, 0) AS orders_count, COALESCE(s.total_spent, 0) AS total_spent
+            FROM customers c
+            LEFT JOIN summary_customer_totals s ON s.customer_id = c.id
+            ORDER BY total_spent DESC
+            """)
+        return cur.fetchall()
+
+    def product_sales(self) -> List[Dict]:
+        cur = execute_query(self.conn, """
+            SELECT p.id AS product_id, p.name AS product_name,
+                   COALESCE(s.total_quantity_sold, 0) AS total_quantity_sold, COALESCE(s.total_revenue, 0) AS total_revenue
+            FROM products p
+            LEFT JOIN summary_product_sales s ON s.product_id = p.id
+            ORDER BY total_revenue DESC
+            """)
+        return cur.fetchall()
+
+    def overall(self) -> Dict:
+        cur = execute_query(self.conn,
+            "SELECT orders_count, total_revenue, min_order_total, max_order_total FROM summary_overall WHERE id = 1")
+        return cur.fetchone() or dict(_EMPTY_OVERALL)
+
+    def _computed(self):
+        customers = {r["customer_id"]: r for r in execute_query(self.conn,
+            "SELECT customer_id, orders_count, total_spent FROM view_customer_order_totals WHERE orders_count > 0").fetchall()}
+        products = {r["product_id"]: r for r in execute_query(self.conn,
+            "SELECT product_id, total_quantity_sold, total_revenue FROM view_product_sales WHERE total_quantity_sold > 0").fetchall()}
+        overall = execute_query(self.conn, """
+            SELECT COUNT(*) AS orders_count, COALESCE(SUM(total_amount), 0) AS total_revenue,
+                   COALESCE(MIN(total_amount), 0) AS min_order_total, COALESCE(MAX(total_amount), 0) AS max_order_total
+            FROM orders
+            """).fetchone()
+        return customers, products, overall
+
+    def verify(self) -> List[str]:
+        """Full scan: differences between the summary tables and the views, empty when in sync."""
+        customers, products, overall = self._computed()
+        stored_customers = {r["customer_id"]: r for r in execute_query(self.conn,
+            "SELECT customer_id, orders_count, total_spent FROM summary_customer_totals").fetchall()}
+        stored_products = {r["product_id"]: r for r in execute_query(self.conn,
+            "SELECT product_id, total_quantity_sold, total_revenue FROM summary_product_sales").fetchall()}
+        drift = []
+        drift += _diff("customer", customers, stored_customers, ("orders_count", "total_spent"))
+        drift += _diff("product", products, stored_products, ("total_quantity_sold", "total_revenue"))
+        drift += _diff("overall", {"totals": overall}, {"totals": self.overall()}, tuple(_EMPTY_OVERALL))
+        return drift
+
+    def rebuild(self) -> None:
+        """Recomputes all summary tables from the views and commits."""
+        try:
+            # Same lock order as add_order(); the INSERT ... SELECTs are locking reads, so an order
+            # created meanwhile either commits before they run or waits for this commit.
+            execute_query(self.conn, "DELETE FROM summary_customer_totals")
+            execute_query(self.conn, "DELETE FROM summary_product_sales")
+            execute_query(self.conn, "DELETE FROM summary_overall")
+            execute_query(self.conn, """
+                INSERT INTO summary_customer_totals (customer_id, orders_count, total_spent)
+                SELECT customer_id, orders_count, total_spent FROM view_customer_order_totals WHERE orders_count > 0
+                """)
+            execute_query(self.conn, """
+                INSERT INTO summary_product_sales (product_id, total_quantity_sold, total_revenue)
+                SELECT product_id, total_quantity_sold, total_revenue FROM view_product_sales WHERE total_quantity_sold > 0
+                """)
+            execute_query(self.conn, """
+                INSERT INTO summary_overall (id, orders_count, total_revenue, min_order_total, max_order_total)
+                SELECT 1, COUNT(*), COALESCE(SUM(total_amount), 0), COALESCE(MIN(total_amount), 0), COALESCE(MAX(total_amount), 0)
+                FROM orders
+                """)
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+
+def _as_stored(value: float) -> float:
+    """value as a FLOAT column keeps it (single precision): 1234567.89 is stored as 1234567.875."""
+    return struct.unpack("f", struct.pack("f", value))[0]
+
+def _diff(kind: str, expected: Dict, stored: Dict, fields) -> List[str]:
+    drift = []
+    for key in sorted(expected.keys() | stored.keys()):
+        exp, got = expected.get(key), stored.get(key)
+        for field in fields:
+            want = float(exp[field]) if exp else 0.0
+            have = float(got[field]) if got else 0.0
+            if abs(want - have) > TOLERANCE:
+                drift.append(f"{kind} {key}: {field} is {have:g}, expected {want:g}")
+    return drift
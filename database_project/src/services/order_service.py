@@ -3,6 +3,7 @@ from datetime import date
 from ..db import DBError, execute_query
 from ..repositories.order import OrderRepository
 from ..repositories.product import ProductRepository
+from ..repositories.summary import SummaryRepository
 
 class OrderServiceError(Exception):
     pass
@@ -12,11 +13,12 @@ class OrderService:
         self.conn = conn
         self.order_repo = OrderRepository(conn)
         self.product_repo = ProductRepository(conn)
+        self.summary_repo = SummaryRepository(conn)
 
     def create_order_transaction(self, customer_id: int, items: List[Dict], order_date: date, delivery_time: str | None) -> int:
         """
         items: list of dicts {product_id: int, quantity: int}
-        Transaction across orders, order_items, products (stock).
+        Transaction across orders, order_items, products (stock) and the report summary tables.
         """
         try:
             total_amount = 0.0
@@ -58,6 +60,9 @@ class OrderService:
                     "UPDATE products SET stock = stock - %s WHERE id=%s",
                     (pi["quantity"], pi["product_id"]))
 
+            # Report aggregates, last so the summary rows stay locked only briefly
+            self.summary_repo.add_order(customer_id, total_amount, prepared)
+
             # Commit
             self.conn.commit()
             return order_id
@@ -0,0 +1,46 @@
+"""
+Checks and repairs the report summary tables.
+
+    python -m src.summary verify            # lists drift, exit code 1 when there is any
+    python -m src.summary verify --repair   # rebuilds the tables when drift is found
+    python -m src.summary rebuild           # recomputes the tables from orders and order_items
+"""
+import argparse
+import sys
+from .db import DBError, get_connection
+from .repositories.summary import SummaryRepository
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m src.summary", description="Report summary tables.")
+    parser.add_argument("command", choices=("verify", "rebuild"))
+    parser.add_argument("--repair", action="store_true", help="verify: rebuild when drift is found")
+    args = parser.parse_args(argv)
+
+    try:
+        conn = get_connection()
+    except Exception as e:
+        print(f"Cannot connect to database: {str(e)}", file=sys.stderr)
+        return 2
+    try:
+        repo = SummaryRepository(conn)
+        if args.command == "verify":
+            drift = repo.verify()
+            conn.rollback()
+            for line in drift:
+                print(line)
+            if not drift:
+                print("Summary tables are in sync.")
+                return 0
+            if not args.repair:
+                return 1
+        repo.rebuild()
+        print("Summary tables rebuilt.")
+        return 0
+    except DBError as e:
+        print(f"Database error: {str(e)}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
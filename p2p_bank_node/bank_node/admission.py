@@ -0,0 +1,126 @@
+import queue
+import socket
+import threading
+import time
+
+from .metrics import METRICS
+
+OVERLOAD_REPLY = "ER Server je přetížen, zkuste to prosím později.\n".encode("utf-8")
+
+
+class Admission:
+    """
+    Connection limits of one server process, checked at accept: at most max_connections open
+    connections (served or waiting for a handler) and at most max_per_ip of them from one client IP.
+    Every admitted connection must be released when it closes.
+    """
+
+    def __init__(self, max_connections: int, max_per_ip: int):
+        self.max_connections = max_connections
+        self.max_per_ip = max_per_ip
+        self.connections = 0
+        self._per_ip: dict[str, int] = {}
+        self._lock = threading.Lock()
+        METRICS.gauge_fn("admitted_connections", lambda: self.connections)
+
+    def admit(self, ip: str) -> str | None:
+        """None when the connection may be served, otherwise the reason for shedding it."""
+        with self._lock:
+            if self.connections >= self.max_connections:
+                return "max_connections"
+            if self._per_ip.get(ip, 0) >= self.max_per_ip:
+                return "per_ip"
+            self.connections += 1
+            self._per_ip[ip] = self._per_ip.get(ip, 0) + 1
+            return None
+
+    def release(self, ip: str) -> None:
+        with self._lock:
+            self.connections -= 1
+            left = self._per_ip.get(ip, 0) - 1
+            if left > 0:
+                self._per_ip[ip] = left
+            else:
+                self._per_ip.pop(ip, None)
+
+
+def record_rejection(addr, reason: str, logger) -> None:
+    METRICS.inc("connections_rejected_total", {"reason": reason})
+    logger.warning("client_rejected client=%s:%s reason=%s", addr[0], addr[1], reason)
+
+
+def shed(conn: socket.socket, addr, reason: str, logger) -> None:
+    """Best-effort ER reply and close. Never blocks the caller on a slow client."""
+    record_rejection(addr, reason, logger)
+    try:
+        conn.setblocking(False)
+        conn.send(OVERLOAD_REPLY)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+
+
+class HandlerPool:
+    """
+    Bounded pool of connection handler threads (threaded engine).
+
+    Threads are started on demand up to max_threads. A connection that finds every thread busy
+    waits in the queue; submit() refuses it when queue_size connections are waiting already, and a connection
+    that waited longer than queue_timeout_sec is shed instead of served (its client has most likely
+    given up already).
+    """
+
+    def __init__(self, handle, max_threads: int, queue_size: int, queue_timeout_sec: float, logger):
+        self.handle = handle
+        self.max_threads = max_threads
+        self.queue_size = queue_size
+        self.queue_timeout_sec = queue_timeout_sec
+        self.logger = logger
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+        self._pending = 0  # submitted, not yet picked up by a thread
+        METRICS.gauge_fn("handler_queue_depth", self.waiting)
+        METRICS.gauge_fn("handler_threads", lambda: self._threads)
+        METRICS.gauge_fn("handler_threads_busy", lambda: self._threads - self._idle)
+
+    def waiting(self) -> int:
+        """Connections that have no thread to go to."""
+        return max(0, self._pending - self._idle)
+
+    def submit(self, conn: socket.socket, addr, done) -> bool:
+        """Queues the connection; done(addr) runs after it was handled or shed. False = queue full."""
+        with self._lock:
+            self._pending += 1
+            if self._pending > self._idle:
+                if self._threads < self.max_threads:
+                    self._threads += 1
+                    self._idle += 1
+                    threading.Thread(target=self._worker, name=f"handler-{self._threads}", daemon=True).start()
+                elif self._pending - self._idle > self.queue_size:
+                    self._pending -= 1
+                    return False
+        self._queue.put((conn, addr, done, time.monotonic()))
+        return True
+
+    def _worker(self):
+        while True:
+            conn, addr, done, queued_at = self._queue.get()
+            with self._lock:
+                self._pending -= 1
+                self._idle -= 1
+            try:
+                waited = time.monotonic() - queued_at
+                METRICS.observe("handler_queue_wait_ms", waited * 1000)
+                if waited > self.queue_timeout_sec:
+                    shed(conn, addr, "queue_timeout", self.logger)
+                else:
+                    self.handle(conn, addr)
+            except Exception:
+                self.logger.exception("handler_failed client=%s:%s", addr[0], addr[1])
+            finally:
+                done(addr)
+                with self._lock:
+                    self._idle += 1
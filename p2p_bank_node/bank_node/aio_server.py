@@ -0,0 +1,252 @@
+import asyncio
+import time
+
+from .protocol import parse_command, validate_and_normalize, ProtocolError
+from .bank import Bank, BankError
+from .proxy import (forward_commands_async, PeerRegistry, ReadCoalescer, ProxyError, build_peer_registry,
+                    build_read_coalescer)
+from .survey import SURVEY_CODES, run_survey_async
+from .admission import Admission, OVERLOAD_REPLY, record_rejection
+from .server import observe_command, observe_proxy, BINARY_HANDSHAKE_REPLY, MAX_LINE_BYTES, LINE_TOO_LONG_REPLY
+from .commands import (is_proxied, PROXIED_READ_CODES, execute, execute_local, format_request, parse_reply, group_batch,
+                       execute_batch_local, format_batch_reply)
+from .binproto import FRAME_HEADER, decode_request, encode_reply
+from .metrics import METRICS
+from .profiler import PROFILER
+from .logging_setup import access_log_sampled
+
+
+async def _forward_async(target: str, line: str, cfg, peers: PeerRegistry) -> str:
+    return (await _forward_many_async(target, [line], cfg, peers))[0]
+
+
+async def _proxy_async(cmd: dict, line: str, cfg, peers: PeerRegistry, reads: ReadCoalescer | None) -> str:
+    target = cmd["bank_ip"]
+    if reads is not None and cmd["code"] in PROXIED_READ_CODES:
+        key = format_request(cmd)
+        return await reads.call_async(key, _forward_async, target, key, cfg, peers)
+    return await _forward_async(target, line, cfg, peers)
+
+
+async def _forward_many_async(target: str, lines: list[str], cfg, peers: PeerRegistry) -> list[str]:
+    proxy_started = time.perf_counter()
+    try:
+        resp = await peers.call_async(target, forward_commands_async, target, int(cfg["bank"]["port"]), lines,
+                                      float(cfg["timeouts"]["proxy_timeout_sec"]),
+                                      float(cfg["timeouts"]["proxy_connect_timeout_sec"]))
+    except ProxyError:
+        observe_proxy(target, proxy_started, True)
+        raise
+    observe_proxy(target, proxy_started, False)
+    return resp
+
+
+async def _forward_group_async(target: str, lines: list[str], cfg, peers: PeerRegistry) -> list[str]:
+    try:
+        return await _forward_many_async(target, lines, cfg, peers)
+    except ProxyError as e:
+        return [f"ER Proxy chyba: {e}"] * len(lines)
+
+
+async def _run_batch_async(cmd: dict, cfg, bank: Bank, peers: PeerRegistry) -> str:
+    ops = cmd["ops"]
+    local, remote = group_batch(cmd, cfg["bank"]["code"])
+    groups = [_forward_group_async(target, [format_request(ops[i]) for i in idx], cfg, peers)
+              for target, idx in remote.items()]
+    if local:
+        groups.append(asyncio.get_running_loop().run_in_executor(
+            None, execute_batch_local, [ops[i] for i in local], bank))
+    replies = await asyncio.gather(*groups)
+
+    results: list[str] = [""] * len(ops)
+    for idx, group in zip(list(remote.values()) + ([local] if local else []), replies):
+        for i, resp in zip(idx, group):
+            results[i] = resp
+    return format_batch_reply(results)
+
+
+async def _process_line_async(line: str, addr, cfg, bank: Bank, logger, peers: PeerRegistry,
+                              reads: ReadCoalescer | None) -> str:
+    bank_ip = cfg["bank"]["code"]
+
+    if not line:
+        return "ER Prazdny prikaz."
+
+    started = time.perf_counter()
+    code = "invalid"
+    target = "-"
+    try:
+        cmd = validate_and_normalize(*parse_command(line))
+        code = cmd["code"]
+        PROFILER.phase("parse", started)
+
+        if code == "BP":
+            resp = BINARY_HANDSHAKE_REPLY
+        elif code == "BT":
+            resp = await _run_batch_async(cmd, cfg, bank, peers)
+        elif code in SURVEY_CODES:
+            resp = await run_survey_async(code, cfg, bank, peers)
+        elif is_proxied(cmd, bank_ip):
+            target = cmd["bank_ip"]
+            resp = await _proxy_async(cmd, line, cfg, peers, reads)
+        else:
+            # Bank calls take a lock and persist to disk, keep them off the event loop.
+            resp = await asyncio.get_running_loop().run_in_executor(None, execute_local, cmd, bank, bank_ip)
+
+        observe_command(code, started, resp.startswith("ER "))
+        if access_log_sampled(cfg):
+            logger.info('access client=%s:%s line="%s" resp="%s" proxy=%s ms=%.2f',
+                        addr[0], addr[1], line, resp, target, (time.perf_counter() - started) * 1000)
+        return resp
+
+    except (ProtocolError, BankError) as e:
+        observe_command(code, started, True)
+        msg = str(e)
+        logger.warning('client=%s:%s line="%s" error="%s"', addr[0], addr[1], line, msg)
+        return "ER " + msg
+    except ProxyError as e:
+        observe_command(code, started, True)
+        msg = f"Proxy chyba: {e}"
+        logger.warning('client=%s:%s line="%s" proxy=%s error="%s"', addr[0], addr[1], line, target, msg)
+        return "ER " + msg
+    except Exception as e:
+        observe_command(code, started, True)
+        msg = f"Chyba v aplikaci, prosím zkuste to později. ({e})"
+        logger.exception(msg)
+        return "ER " + msg
+
+
+async def _process_frame_async(body: bytes, addr, cfg, bank: Bank, logger, peers: PeerRegistry,
+                               reads: ReadCoalescer | None) -> bytes:
+    bank_ip = cfg["bank"]["code"]
+
+    started = time.perf_counter()
+    code = "invalid"
+    target = "-"
+    try:
+        cmd = decode_request(body)
+        code = cmd["code"]
+        PROFILER.phase("parse", started)
+
+        if is_proxied(cmd, bank_ip):
+            # Peers speak the text protocol.
+            target = cmd["bank_ip"]
+            reply = parse_reply(await _proxy_async(cmd, format_request(cmd), cfg, peers, reads))
+        else:
+            reply = await asyncio.get_running_loop().run_in_executor(None, execute, cmd, bank, bank_ip)
+
+        observe_command(code, started, reply[0] == "ER")
+        if access_log_sampled(cfg):
+            logger.info('access client=%s:%s frame="%s" resp=%s proxy=%s ms=%.2f',
+                        addr[0], addr[1], format_request(cmd), reply[0], target, (time.perf_counter() - started) * 1000)
+        return encode_reply(*reply)
+
+    except (ProtocolError, BankError) as e:
+        observe_command(code, started, True)
+        msg = str(e)
+        logger.warning('client=%s:%s frame error="%s"', addr[0], addr[1], msg)
+        return encode_reply("ER", msg)
+    except ProxyError as e:
+        observe_command(code, started, True)
+        msg = f"Proxy chyba: {e}"
+        logger.warning('client=%s:%s frame proxy=%s error="%s"', addr[0], addr[1], target, msg)
+        return encode_reply("ER", msg)
+    except Exception as e:
+        observe_command(code, started, True)
+        msg = f"Chyba v aplikaci, prosím zkuste to později. ({e})"
+        logger.exception(msg)
+        return encode_reply("ER", msg)
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    (size,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    return await reader.readexactly(size)
+
+
+async def _handle_client_async(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, cfg, bank: Bank, logger,
+                               peers: PeerRegistry, reads: ReadCoalescer | None):
+    idle_timeout = float(cfg["timeouts"]["client_idle_timeout_sec"])
+
+    addr = writer.get_extra_info("peername") or ("?", 0)
+    logger.info("client_connected client=%s:%s", addr[0], addr[1])
+    METRICS.add_gauge("active_connections", 1)
+    binary = False
+
+    try:
+        while True:
+            try:
+                if binary:
+                    body = await asyncio.wait_for(_read_frame(reader), idle_timeout)
+                    reply = await _process_frame_async(body, addr, cfg, bank, logger, peers, reads)
+                    send_started = time.perf_counter()
+                    writer.write(reply)
+                    await writer.drain()
+                    PROFILER.phase("send", send_started)
+                    continue
+                data = await asyncio.wait_for(reader.readline(), idle_timeout)
+            except asyncio.TimeoutError:
+                logger.info("client_timeout client=%s:%s", addr[0], addr[1])
+                return
+            except (ValueError, asyncio.LimitOverrunError):
+                # readline() past the stream limit: same reply as the threaded engine, then close.
+                logger.warning("client_line_too_long client=%s:%s", addr[0], addr[1])
+                writer.write(LINE_TOO_LONG_REPLY)
+                await writer.drain()
+                return
+            except (ConnectionError, asyncio.IncompleteReadError):
+                logger.info("client_closed client=%s:%s", addr[0], addr[1])
+                return
+
+            if not data.endswith(b"\n"):
+                logger.info("client_closed client=%s:%s", addr[0], addr[1])
+                return
+
+            line = data.decode("utf-8", errors="replace").strip()
+            resp = await _process_line_async(line, addr, cfg, bank, logger, peers, reads)
+            send_started = time.perf_counter()
+            writer.write((resp + "\n").encode("utf-8"))
+            await writer.drain()
+            PROFILER.phase("send", send_started)
+            if resp == BINARY_HANDSHAKE_REPLY:
+                binary = True
+                logger.info("client_binary client=%s:%s", addr[0], addr[1])
+
+    except ConnectionError:
+        logger.info("client_closed client=%s:%s", addr[0], addr[1])
+    finally:
+        METRICS.add_gauge("active_connections", -1)
+        try:
+            writer.close()
+        except Exception:
+            pass
+
+
+async def run_async_server(cfg: dict, bank: Bank, logger, reuse_port: bool = False):
+    bank_ip = cfg["bank"]["ip"]
+    bank_port = int(cfg["bank"]["port"])
+    backlog = int(cfg["server"]["backlog"])
+    peers = build_peer_registry(cfg)
+    reads = build_read_coalescer(cfg)
+    METRICS.gauge_fn("proxy_open_circuits", peers.open_circuits)
+    PROFILER.configure(cfg)
+
+    # No handler threads here, an idle connection costs only its buffers: just the connection caps apply.
+    admission = Admission(int(cfg["server"]["max_connections"]), int(cfg["server"]["max_connections_per_ip"]))
+
+    async def on_client(reader, writer):
+        addr = writer.get_extra_info("peername") or ("?", 0)
+        reason = admission.admit(addr[0])
+        if reason is not None:
+            record_rejection(addr, reason, logger)
+            writer.write(OVERLOAD_REPLY)
+            writer.close()
+            return
+        try:
+            await _handle_client_async(reader, writer, cfg, bank, logger, peers, reads)
+        finally:
+            admission.release(addr[0])
+
+    srv = await asyncio.start_server(on_client, bank_ip, bank_port, backlog=backlog, reuse_address=True,
+                                     reuse_port=reuse_port or None, limit=MAX_LINE_BYTES)
+    async with srv:
+        await srv.serve_forever()
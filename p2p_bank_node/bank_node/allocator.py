@@ -0,0 +1,54 @@
+import random
+import threading
+from array import array
+
+ACCOUNT_MIN = 10000
+ACCOUNT_MAX = 99999
+
+
+class AccountAllocator:
+    """
+    Free list of unused account numbers. allocate() picks a random free slot and
+    swap-removes it, release() puts a number back; both are O(1) at any occupancy.
+    _pos[acct - ACCOUNT_MIN] is the index of acct in _free, or -1 when the number is taken.
+    """
+
+    def __init__(self, used):
+        used = set(used)
+        self._lock = threading.Lock()
+        self._free = array("i", (a for a in range(ACCOUNT_MIN, ACCOUNT_MAX + 1) if a not in used))
+        self._pos = array("i", [-1]) * (ACCOUNT_MAX - ACCOUNT_MIN + 1)
+        for i, acct in enumerate(self._free):
+            self._pos[acct - ACCOUNT_MIN] = i
+
+    def free_count(self) -> int:
+        return len(self._free)
+
+    def allocate(self) -> int | None:
+        with self._lock:
+            if not self._free:
+                return None
+            return self._take(random.randrange(len(self._free)))
+
+    def reserve(self, acct: int) -> None:
+        """Marks a number as taken (an account created elsewhere, e.g. replicated from the primary)."""
+        with self._lock:
+            i = self._pos[acct - ACCOUNT_MIN]
+            if i >= 0:
+                self._take(i)
+
+    def release(self, acct: int) -> None:
+        with self._lock:
+            if self._pos[acct - ACCOUNT_MIN] >= 0:
+                return
+            self._pos[acct - ACCOUNT_MIN] = len(self._free)
+            self._free.append(acct)
+
+    def _take(self, i: int) -> int:
+        acct = self._free[i]
+        last = self._free.pop()
+        if last != acct:
+            self._free[i] = last
+            self._pos[last - ACCOUNT_MIN] = i
+        self._pos[acct - ACCOUNT_MIN] = -1
+        return acct
@@ -1,9 +1,18 @@
+import ipaddress
 import os
+import socket
 
 from p2p_bank_node.libs.pvl_cli import build_parser
 from p2p_bank_node.libs.pvl_config import load_yaml_config, ConfigError
+from p2p_bank_node.libs.pvl_persist import DURABILITY_LEVELS
 
 from .server import run_server
+from .survey import MAX_SCAN_HOSTS
+
+
+# server.max_connections / max_connections_per_ip when left null. A threaded connection holds
+# a handler thread, an asyncio one only its buffers, so asyncio is sized for 10k+ idle clients.
+ENGINE_CONNECTION_DEFAULTS = {"threaded": (1000, 100), "asyncio": (20000, 20000)}
 
 
 def _validate_bank_config(cfg: dict) -> dict:
@@ -19,14 +28,112 @@ def _validate_bank_config(cfg: dict) -> dict:
     timeouts = cfg["timeouts"]
     timeouts.setdefault("client_idle_timeout_sec", 5.0)
     timeouts.setdefault("proxy_timeout_sec", 5.0)
+    timeouts.setdefault("proxy_connect_timeout_sec", min(3.0, float(timeouts["proxy_timeout_sec"])))
 
     storage = cfg["storage"]
     if "data_file" not in storage:
         raise ConfigError("Missing storage.data_file in config.")
+    storage.setdefault("mode", "json")
+    storage.setdefault("wal_file", storage["data_file"] + ".wal")
+    storage.setdefault("wal_durability", "batch")
+    storage.setdefault("wal_flush_interval_sec", 0.05)
+    storage.setdefault("wal_checkpoint_ops", 100000)
+    storage.setdefault("wal_checkpoint_mb", 64)
+    storage.setdefault("snapshot_dir", os.path.join(os.path.dirname(storage["data_file"]) or ".", "snapshots"))
+    storage.setdefault("snapshot_interval_sec", 60.0)
+    storage.setdefault("mmap_file", storage["data_file"] + ".map")
+    if storage["mode"] not in ("json", "wal", "snapshot", "mmap"):
+        raise ConfigError("storage.mode must be 'json', 'wal', 'snapshot' or 'mmap'.")
+    if storage["wal_durability"] not in DURABILITY_LEVELS:
+        raise ConfigError(f"storage.wal_durability must be one of {', '.join(DURABILITY_LEVELS)}.")
+
+    server = cfg.get("server") or {}
+    cfg["server"] = server
+    server.setdefault("engine", "threaded")
+    server.setdefault("backlog", 50)
+    server.setdefault("workers", 0)
+    server.setdefault("ipc_connections_per_worker", 8)
+    server.setdefault("handler_threads", 200)
+    server.setdefault("handler_queue", 200)
+    server.setdefault("handler_queue_timeout_sec", 5.0)
+    if server["engine"] not in ENGINE_CONNECTION_DEFAULTS:
+        raise ConfigError("server.engine must be 'threaded' or 'asyncio'.")
+    max_connections, max_per_ip = ENGINE_CONNECTION_DEFAULTS[server["engine"]]
+    if server.get("max_connections") is None:
+        server["max_connections"] = max_connections
+    if server.get("max_connections_per_ip") is None:
+        server["max_connections_per_ip"] = max_per_ip
+    for key in ("max_connections", "max_connections_per_ip", "handler_threads", "handler_queue"):
+        if int(server[key]) < 1:
+            raise ConfigError(f"server.{key} must be >= 1.")
+    if int(server["workers"]) > 0 and not hasattr(socket, "SO_REUSEPORT"):
+        raise ConfigError("server.workers > 0 needs SO_REUSEPORT (Linux/BSD), not available on this OS.")
+
+    proxy = cfg.get("proxy") or {}
+    cfg["proxy"] = proxy
+    proxy.setdefault("pool_enabled", True)
+    proxy.setdefault("max_connections_per_peer", 8)
+    proxy.setdefault("pool_idle_ttl_sec", 4.0)
+    proxy.setdefault("breaker_failure_threshold", 3)
+    proxy.setdefault("breaker_open_sec", 10.0)
+    proxy.setdefault("negative_cache_sec", 5.0)
+    proxy.setdefault("coalesce_reads", True)
+    proxy.setdefault("read_cache_ttl_sec", 0.0)
+    if int(proxy["breaker_failure_threshold"]) < 1:
+        raise ConfigError("proxy.breaker_failure_threshold must be >= 1.")
+    if int(proxy["max_connections_per_peer"]) < 1:
+        raise ConfigError("proxy.max_connections_per_peer must be >= 1.")
+
+    replication = cfg.get("replication") or {}
+    cfg["replication"] = replication
+    replication.setdefault("role", "primary")
+    replication.setdefault("port", None)
+    replication.setdefault("primary", None)
+    replication.setdefault("backlog_ops", 100000)
+    if replication["role"] not in ("primary", "follower"):
+        raise ConfigError("replication.role must be 'primary' or 'follower'.")
+    if replication["role"] == "follower":
+        host, sep, port = str(replication["primary"] or "").rpartition(":")
+        if not sep or not host or not port.isdigit():
+            raise ConfigError("replication.primary must be '<ip>:<port>' for a follower.")
+        # Accounts of a follower are the primary's: <account>/<primary ip>.
+        bank.setdefault("code", host)
+    bank.setdefault("code", bank["ip"])
+
+    network = cfg.get("network") or {}
+    cfg["network"] = network
+    network.setdefault("peers", [])
+    network.setdefault("scan", None)
+    network.setdefault("deadline_sec", 2.0)
+    network.setdefault("max_parallel", 64)
+    try:
+        for ip in network["peers"]:
+            ipaddress.IPv4Address(str(ip))
+        if network["scan"] and ipaddress.ip_network(network["scan"], strict=False).num_addresses > MAX_SCAN_HOSTS:
+            raise ConfigError(f"network.scan may cover at most {MAX_SCAN_HOSTS} addresses.")
+    except ValueError as e:
+        raise ConfigError(f"Invalid network.peers / network.scan: {e}")
+
+    profiler = cfg.get("profiler") or {}
+    cfg["profiler"] = profiler
+    profiler.setdefault("enabled", False)
+    profiler.setdefault("sample_hz", 100.0)
+    profiler.setdefault("out_dir", "logs/profiles")
+    if not 0 < float(profiler["sample_hz"]) <= 1000:
+        raise ConfigError("profiler.sample_hz must be in (0, 1000].")
+
+    metrics = cfg.get("metrics") or {}
+    cfg["metrics"] = metrics
+    metrics.setdefault("http_port", None)
 
     logging_cfg = cfg["logging"]
     logging_cfg.setdefault("level", "INFO")
     logging_cfg.setdefault("file", "logs/bank.log")
+    logging_cfg.setdefault("mode", "sync")
+    logging_cfg.setdefault("queue_size", 10000)
+    logging_cfg.setdefault("access_sample_rate", 1.0)
+    if logging_cfg["mode"] not in ("sync", "queue"):
+        raise ConfigError("logging.mode must be 'sync' or 'queue'.")
 
     return cfg
 
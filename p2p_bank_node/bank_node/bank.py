@@ -1,47 +1,194 @@
-import random
 import threading
+import time
+from contextlib import ExitStack
 
-from p2p_bank_node.libs.pvl_persist import load_json, save_json_atomic, PersistenceError
+from p2p_bank_node.libs.pvl_persist import PersistenceError
+
+from .allocator import AccountAllocator
+from .metrics import METRICS
+from .profiler import PROFILER
+from .replication import ReplicationError
+from .storage import change_record, batch_record
+
+LOCK_STRIPES = 64
+
+
+class _TimedLock:
+    """Lock that records how long a contended acquire waited (lock_wait_ms)."""
+
+    __slots__ = ("_lock", "_held_since")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._held_since = 0.0
+
+    def __enter__(self):
+        if not self._lock.acquire(blocking=False):
+            started = time.perf_counter()
+            self._lock.acquire()
+            METRICS.observe("lock_wait_ms", (time.perf_counter() - started) * 1000)
+            PROFILER.phase("lock_wait", started)
+        # Profiling: time under the lock is the "mutation" phase (it includes the log append).
+        self._held_since = time.perf_counter() if PROFILER.enabled else 0.0
+        return self
+
+    def __exit__(self, *exc):
+        if self._held_since:
+            PROFILER.phase("mutation", self._held_since)
+        self._lock.release()
 
 
 class BankError(Exception):
     pass
 
 
+class BatchError(BankError):
+    """A batch operation failed, nothing of the batch was applied. index is the failing operation."""
+
+    def __init__(self, index: int, msg: str):
+        super().__init__(msg)
+        self.index = index
+
+
 class Bank:
-    def __init__(self, bank_ip: str, data_file: str, logger):
+    """
+    Accounts are guarded by LOCK_STRIPES locks (account % LOCK_STRIPES), so operations
+    on different accounts run in parallel. BA/BN come from running totals updated on every change.
+
+    Replication: on a primary every persisted change also gets its place in feed under the stripe
+    lock (so the feed order matches the order of changes of each account) and is confirmed to
+    followers only after _wait_persisted(), so they never apply a change the primary could lose.
+    A follower is read_only and changes only through apply_replicated() / apply_replica_snapshot().
+    """
+
+    def __init__(self, bank_ip: str, storage, logger):
         self.bank_ip = bank_ip
-        self.data_file = data_file
+        self.storage = storage
         self.logger = logger
-        self._lock = threading.Lock()
+        self._stripes = [_TimedLock() for _ in range(LOCK_STRIPES)]
+        self._agg_lock = threading.Lock()
         self.accounts: dict[int, int] = {}
+        self._total = 0
+        self._count = 0
+        self._allocator = AccountAllocator(())
+        self.recovery_ms = 0.0
+        self.read_only = False
+        self.feed = None
+        self.replication = None
+
+    def _lock_for(self, acct: int) -> _TimedLock:
+        return self._stripes[acct % LOCK_STRIPES]
+
+    def _check_writable(self) -> None:
+        if self.read_only:
+            raise BankError("Node je follower, jen pro čtení. Změny posílejte na primární node.")
+
+    def _adjust_totals(self, amount_delta: int, count_delta: int) -> None:
+        with self._agg_lock:
+            self._total += amount_delta
+            self._count += count_delta
 
     def load_from_disk(self):
-        raw = load_json(self.data_file, default={"accounts": {}})
-        acc = {}
-        for k, v in (raw.get("accounts") or {}).items():
-            acc[int(k)] = int(v)
-        self.accounts = acc
-        self.logger.info(f"Loaded accounts: {len(self.accounts)}")
-
-    def _persist(self):
+        started = time.perf_counter()
         try:
-            save_json_atomic(self.data_file, {"accounts": self.accounts})
+            self.accounts = self.storage.load()
         except PersistenceError as e:
             raise BankError(f"Chyba uložiště: {e}")
+        self._total = sum(self.accounts.values())
+        self._count = len(self.accounts)
+        self._allocator = AccountAllocator(self.accounts.keys())
+        self.recovery_ms = (time.perf_counter() - started) * 1000
+        self.logger.info("Loaded accounts: %d", len(self.accounts))
+        self.logger.info("recovery records_replayed=%d recovery_ms=%.1f", self.storage.records_replayed, self.recovery_ms)
+
+    def start_snapshots(self) -> None:
+        interval = self.storage.snapshot_interval_sec
+        if not interval:
+            return
+        t = threading.Thread(target=self._snapshot_loop, args=(interval,), name="bank-snapshot", daemon=True)
+        t.start()
+
+    def _snapshot_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            try:
+                self.snapshot()
+            except PersistenceError as e:
+                self.logger.error('snapshot_failed error="%s"', e)
+
+    def snapshot(self) -> None:
+        if not self.storage.snapshot_due():
+            # Checked without the stripes, begin_snapshot() decides again under them.
+            return
+        started = time.perf_counter()
+        # A consistent cut needs every stripe.
+        with ExitStack() as stack:
+            for lock in self._stripes:
+                stack.enter_context(lock)
+            job = self.storage.begin_snapshot(self.accounts)
+        if job is None:
+            return
+        self.storage.write_snapshot(job)
+        self.logger.info("snapshot_written accounts=%d ms=%.1f", len(job[1]), (time.perf_counter() - started) * 1000)
+
+    def close(self) -> None:
+        self.storage.close()
+
+    def _persist(self, acct: int, balance: int | None):
+        """Called under the account's stripe lock. Returns a token for _wait_persisted()."""
+        started = time.perf_counter()
+        try:
+            token = self.storage.write(self.accounts, acct, balance)
+        except PersistenceError as e:
+            raise BankError(f"Chyba uložiště: {e}")
+        finally:
+            METRICS.observe("persist_write_ms", (time.perf_counter() - started) * 1000)
+            PROFILER.phase("persist", started)
+        seq = self.feed.publish(change_record(acct, balance)) if self.feed is not None else None
+        return token, seq
+
+    def _persist_batch(self, changes: dict[int, int | None]):
+        started = time.perf_counter()
+        try:
+            token = self.storage.write_batch(self.accounts, changes)
+        except PersistenceError as e:
+            raise BankError(f"Chyba uložiště: {e}")
+        finally:
+            METRICS.observe("persist_write_ms", (time.perf_counter() - started) * 1000)
+            PROFILER.phase("persist", started)
+        seq = self.feed.publish(batch_record(changes)) if self.feed is not None else None
+        return token, seq
+
+    def _wait_persisted(self, pending) -> None:
+        """Called after the lock is released, so concurrent changes can share one disk flush."""
+        token, seq = pending
+        started = time.perf_counter()
+        try:
+            self.storage.sync(token)
+        except PersistenceError as e:
+            raise BankError(f"Chyba uložiště: {e}")
+        finally:
+            METRICS.observe("persist_sync_ms", (time.perf_counter() - started) * 1000)
+            PROFILER.phase("persist", started)
+            # Also after a failed sync: memory already holds the change and later records must not stall.
+            if seq is not None:
+                self.feed.confirm(seq)
 
     def create_account(self) -> int:
-        with self._lock:
-            for _ in range(200000):
-                acct = random.randint(10000, 99999)
-                if acct not in self.accounts:
-                    self.accounts[acct] = 0
-                    self._persist()
-                    return acct
+        self._check_writable()
+        acct = self._allocator.allocate()
+        if acct is None:
             raise BankError("Nelze vytvořit nový účet.")
+        with self._lock_for(acct):
+            self.accounts[acct] = 0
+            self._adjust_totals(0, 1)
+            token = self._persist(acct, 0)
+        self._wait_persisted(token)
+        return acct
 
     def deposit(self, acct: int, amount: int) -> None:
-        with self._lock:
+        self._check_writable()
+        with self._lock_for(acct):
             if acct not in self.accounts:
                 raise BankError("Účet neexistuje.")
             bal = self.accounts[acct]
@@ -49,37 +196,147 @@ class Bank:
             if new_bal > 9223372036854775807:
                 raise BankError("Přetečení částky (overflow).")
             self.accounts[acct] = new_bal
-            self._persist()
+            self._adjust_totals(amount, 0)
+            token = self._persist(acct, new_bal)
+        self._wait_persisted(token)
 
     def withdraw(self, acct: int, amount: int) -> None:
-        with self._lock:
+        self._check_writable()
+        with self._lock_for(acct):
             if acct not in self.accounts:
                 raise BankError("Účet neexistuje.")
             bal = self.accounts[acct]
             if amount > bal:
                 raise BankError("Není dostatek finančních prostředků.")
             self.accounts[acct] = bal - amount
-            self._persist()
+            self._adjust_totals(-amount, 0)
+            token = self._persist(acct, bal - amount)
+        self._wait_persisted(token)
 
     def balance(self, acct: int) -> int:
-        with self._lock:
-            if acct not in self.accounts:
-                raise BankError("Účet neexistuje.")
-            return self.accounts[acct]
+        # Reading one dict entry is atomic, no lock needed (MappedIntTable.get never raises either).
+        bal = self.accounts.get(acct)
+        if bal is None:
+            raise BankError("Účet neexistuje.")
+        return bal
 
     def remove(self, acct: int) -> None:
-        with self._lock:
+        self._check_writable()
+        with self._lock_for(acct):
             if acct not in self.accounts:
                 raise BankError("Účet neexistuje.")
             if self.accounts[acct] != 0:
                 raise BankError("Nelze smazat bankovní účet na kterém jsou finance.")
             del self.accounts[acct]
-            self._persist()
+            self._adjust_totals(0, -1)
+            self._allocator.release(acct)
+            token = self._persist(acct, None)
+        self._wait_persisted(token)
+
+    def apply_batch(self, ops: list[tuple[str, int, int]]) -> list[int | None]:
+        """
+        Applies (code, account, amount) operations, code AD/AW/AB, all or nothing.
+        Every stripe involved is locked once (in index order, like snapshot()), the changes
+        are persisted as one record. Returns the AB balances (None for AD/AW), raises BatchError.
+        """
+        self._check_writable()
+        stripes = sorted({acct % LOCK_STRIPES for _, acct, _ in ops})
+        changes: dict[int, int] = {}
+        results: list[int | None] = []
+        token = None
+        with ExitStack() as stack:
+            for i in stripes:
+                stack.enter_context(self._stripes[i])
+
+            for index, (code, acct, amount) in enumerate(ops):
+                bal = changes.get(acct, self.accounts.get(acct))
+                if bal is None:
+                    raise BatchError(index, "Účet neexistuje.")
+                if code == "AB":
+                    results.append(bal)
+                    continue
+                if code == "AD":
+                    bal += amount
+                    if bal > 9223372036854775807:
+                        raise BatchError(index, "Přetečení částky (overflow).")
+                else:
+                    if amount > bal:
+                        raise BatchError(index, "Není dostatek finančních prostředků.")
+                    bal -= amount
+                changes[acct] = bal
+                results.append(None)
+
+            if changes:
+                delta = sum(bal - self.accounts[acct] for acct, bal in changes.items())
+                self.accounts.update(changes)
+                self._adjust_totals(delta, 0)
+                token = self._persist_batch(changes)
+        if changes:
+            self._wait_persisted(token)
+        return results
+
+    def apply_replicated(self, changes: dict[int, int | None]) -> None:
+        """Applies changes received from the primary (balance None = removed account)."""
+        if not changes:
+            return
+        stripes = sorted({acct % LOCK_STRIPES for acct in changes})
+        with ExitStack() as stack:
+            for i in stripes:
+                stack.enter_context(self._stripes[i])
+            amount_delta = 0
+            count_delta = 0
+            for acct, bal in changes.items():
+                old = self.accounts.get(acct)
+                if bal is None:
+                    if old is None:
+                        continue
+                    del self.accounts[acct]
+                    self._allocator.release(acct)
+                    amount_delta -= old
+                    count_delta -= 1
+                else:
+                    if old is None:
+                        self._allocator.reserve(acct)
+                        count_delta += 1
+                        old = 0
+                    self.accounts[acct] = bal
+                    amount_delta += bal - old
+            self._adjust_totals(amount_delta, count_delta)
+            token = self._persist_batch(changes)
+        self._wait_persisted(token)
+
+    def apply_replica_snapshot(self, accounts: dict[int, int]) -> None:
+        """Makes the local state equal to a full snapshot of the primary."""
+        changes: dict[int, int | None] = {acct: None for acct in list(self.accounts) if acct not in accounts}
+        for acct, bal in accounts.items():
+            if self.accounts.get(acct) != bal:
+                changes[acct] = bal
+        self.apply_replicated(changes)
+
+    def replication_snapshot(self) -> tuple[int, dict[int, int]]:
+        """Consistent copy of all accounts and the feed sequence number it corresponds to."""
+        with ExitStack() as stack:
+            for lock in self._stripes:
+                stack.enter_context(lock)
+            # Changes already in accounts but not yet on disk; no new ones can start under all stripes.
+            self.feed.wait_confirmed()
+            return self.feed.seq, dict(self.accounts)
+
+    def replication_status(self) -> str:
+        if self.replication is None:
+            return "primary followers=0"
+        return self.replication.status()
+
+    def promote(self) -> str:
+        if self.replication is None:
+            raise BankError("Node už je primární.")
+        try:
+            return self.replication.promote()
+        except ReplicationError as e:
+            raise BankError(str(e))
 
     def total_amount(self) -> int:
-        with self._lock:
-            return sum(self.accounts.values())
+        return self._total
 
     def number_of_clients(self) -> int:
-        with self._lock:
-            return len(self.accounts)
\ No newline at end of file
+        return self._count
@@ -0,0 +1,85 @@
+"""
+Compact binary framing, switched on per connection by the text command BP (reply "BP 1").
+
+Every frame is <u16 body length, little endian><body>.
+
+Request body (17 bytes): u8 opcode, u32 account, 4 bytes IPv4 of the bank, u64 amount.
+Unused fields are zero.
+
+Reply body: u8 opcode + value, the value layout depends on the opcode:
+    BC: 4 bytes IPv4    AC: u32 account    AB: u64    BA: u128    BN: u32
+    AD/AW/AR: nothing   MS/ER: UTF-8 text
+"""
+
+import socket
+import struct
+
+from .protocol import ProtocolError, COMMAND_ARGS
+
+BINARY_VERSION = 1
+
+OPCODES = {"BC": 1, "AC": 2, "AD": 3, "AW": 4, "AB": 5, "AR": 6, "BA": 7, "BN": 8, "MS": 9, "ER": 0xFF}
+CODES = {v: k for k, v in OPCODES.items()}
+
+FRAME_HEADER = struct.Struct("<H")
+REQUEST = struct.Struct("<BI4sQ")
+
+_INT_REPLIES = {"AC": 4, "AB": 8, "BA": 16, "BN": 4}
+_TEXT_REPLIES = ("MS", "ER")
+
+
+def frame(body: bytes) -> bytes:
+    return FRAME_HEADER.pack(len(body)) + body
+
+
+def encode_request(cmd: dict) -> bytes:
+    ip = socket.inet_aton(cmd["bank_ip"]) if "bank_ip" in cmd else b"\0\0\0\0"
+    return frame(REQUEST.pack(OPCODES[cmd["code"]], cmd.get("account", 0), ip, cmd.get("amount", 0)))
+
+
+def decode_request(body: bytes) -> dict:
+    """Same dict shape as protocol.validate_and_normalize()."""
+    if len(body) != REQUEST.size:
+        raise ProtocolError("Špatná délka binárního rámce.")
+    opcode, acct, ip, amount = REQUEST.unpack(body)
+    code = CODES.get(opcode)
+    if code is None or code == "ER" or code not in COMMAND_ARGS:
+        raise ProtocolError("Nepovolený příkaz.")
+
+    cmd = {"code": code}
+    spec = COMMAND_ARGS[code]
+    if "account" in spec:
+        if acct < 10000 or acct > 99999:
+            raise ProtocolError("Číslo účtu musí být v rozsahu 10000 až 99999.")
+        cmd["account"] = acct
+        cmd["bank_ip"] = socket.inet_ntoa(ip)
+    if "amount" in spec:
+        if amount > 9223372036854775807:
+            raise ProtocolError("Částka je mimo povolený rozsah.")
+        cmd["amount"] = amount
+    return cmd
+
+
+def encode_reply(code: str, value) -> bytes:
+    body = bytes((OPCODES[code],))
+    if code == "BC":
+        body += socket.inet_aton(value)
+    elif code in _INT_REPLIES:
+        body += int(value).to_bytes(_INT_REPLIES[code], "little")
+    elif code in _TEXT_REPLIES:
+        body += str(value).encode("utf-8")
+    return frame(body)
+
+
+def decode_reply(body: bytes) -> tuple[str, object]:
+    code = CODES.get(body[0]) if body else None
+    if code is None:
+        raise ProtocolError("Neznámá binární odpověď.")
+    payload = body[1:]
+    if code == "BC":
+        return code, socket.inet_ntoa(payload)
+    if code in _INT_REPLIES:
+        return code, int.from_bytes(payload, "little")
+    if code in _TEXT_REPLIES:
+        return code, payload.decode("utf-8", errors="replace")
+    return code, None
@@ -0,0 +1,155 @@
+from .protocol import ProtocolError
+from .bank import BankError, BatchError
+from .metrics import METRICS
+from .profiler import PROFILER
+
+
+def _bc(cmd, bank, bank_ip):
+    return bank_ip
+
+
+def _ac(cmd, bank, bank_ip):
+    return bank.create_account()
+
+
+def _ad(cmd, bank, bank_ip):
+    bank.deposit(cmd["account"], cmd["amount"])
+
+
+def _aw(cmd, bank, bank_ip):
+    bank.withdraw(cmd["account"], cmd["amount"])
+
+
+def _ab(cmd, bank, bank_ip):
+    return bank.balance(cmd["account"])
+
+
+def _ar(cmd, bank, bank_ip):
+    bank.remove(cmd["account"])
+
+
+def _ba(cmd, bank, bank_ip):
+    return bank.total_amount()
+
+
+def _bn(cmd, bank, bank_ip):
+    return bank.number_of_clients()
+
+
+def _ms(cmd, bank, bank_ip):
+    return METRICS.summary_line()
+
+
+def _rs(cmd, bank, bank_ip):
+    return bank.replication_status()
+
+
+def _rp(cmd, bank, bank_ip):
+    return bank.promote()
+
+
+def _pf(cmd, bank, bank_ip):
+    # Profiles the process that handles the command, like MS shows its metrics.
+    try:
+        return PROFILER.command(cmd["action"])
+    except OSError as e:
+        raise BankError(f"Profil nelze uložit: {e}")
+
+
+# Local execution of every command, shared by the text and the binary protocol.
+# A handler returns the reply value (or None for a bare "AD", "AW", "AR").
+LOCAL_HANDLERS = {
+    "BC": _bc,
+    "AC": _ac,
+    "AD": _ad,
+    "AW": _aw,
+    "AB": _ab,
+    "AR": _ar,
+    "BA": _ba,
+    "BN": _bn,
+    "MS": _ms,
+    "RS": _rs,
+    "RP": _rp,
+    "PF": _pf,
+}
+
+PROXIED_CODES = ("AD", "AW", "AB")
+# Proxied commands without side effects, identical concurrent ones may share one upstream request.
+PROXIED_READ_CODES = ("AB",)
+
+
+def is_proxied(cmd: dict, bank_ip: str) -> bool:
+    return cmd["code"] in PROXIED_CODES and cmd.get("bank_ip") != bank_ip
+
+
+def execute(cmd: dict, bank, bank_ip: str) -> tuple[str, object]:
+    handler = LOCAL_HANDLERS.get(cmd["code"])
+    if handler is None:
+        raise ProtocolError("Nepovolený příkaz.")
+    return cmd["code"], handler(cmd, bank, bank_ip)
+
+
+def format_reply(code: str, value, bank_ip: str) -> str:
+    if code == "AC":
+        return f"AC {value}/{bank_ip}"
+    if value is None:
+        return code
+    return f"{code} {value}"
+
+
+def execute_local(cmd: dict, bank, bank_ip: str) -> str:
+    return format_reply(*execute(cmd, bank, bank_ip), bank_ip)
+
+
+def format_request(cmd: dict) -> str:
+    """Text line of a validated command (used to proxy binary requests to peers)."""
+    parts = [cmd["code"]]
+    if "account" in cmd:
+        parts.append(f"{cmd['account']}/{cmd['bank_ip']}")
+    if "amount" in cmd:
+        parts.append(str(cmd["amount"]))
+    return " ".join(parts)
+
+
+def parse_reply(text: str) -> tuple[str, object]:
+    """Text reply of a peer -> (code, value), the inverse of format_reply for proxied commands."""
+    code, _, rest = text.partition(" ")
+    if code == "ER":
+        return "ER", rest
+    if code == "AB" and rest.isdigit():
+        return "AB", int(rest)
+    if code in ("AD", "AW") and not rest:
+        return code, None
+    return "ER", f"Neplatná odpověď cílové banky: {text}"
+
+
+def group_batch(cmd: dict, bank_ip: str) -> tuple[list[int], dict[str, list[int]]]:
+    """Indexes of the BT operations for this bank and, per peer IP, for other banks."""
+    local: list[int] = []
+    remote: dict[str, list[int]] = {}
+    for i, op in enumerate(cmd["ops"]):
+        if is_proxied(op, bank_ip):
+            remote.setdefault(op["bank_ip"], []).append(i)
+        else:
+            local.append(i)
+    return local, remote
+
+
+def execute_batch_local(ops: list[dict], bank) -> list[str]:
+    """
+    Text reply of every local operation. All or nothing: after a failure every operation gets ER.
+    Never raises, the operations for other banks of the same BT are already on their way.
+    """
+    try:
+        values = bank.apply_batch([(op["code"], op["account"], op.get("amount", 0)) for op in ops])
+    except BatchError as e:
+        return [f"ER {e}" if i == e.index else "ER Dávka nebyla provedena." for i in range(len(ops))]
+    except BankError as e:
+        # Read-only follower or failed persist: the batch as a whole, no operation to blame.
+        return [f"ER {e}"] * len(ops)
+    return [format_reply(op["code"], value, "") for op, value in zip(ops, values)]
+
+
+def format_batch_reply(results: list[str]) -> str:
+    # ";" separates the results, keep it out of error texts (peer replies included).
+    return "BT " + ";".join(r.replace(";", ",") for r in results)
@@ -1,7 +1,40 @@
 import logging
+import logging.handlers
+import queue
+import random
+import threading
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue without blocking. When the writer thread falls behind
+    (slow disk or console) new records are dropped and counted instead of stalling requests.
+    """
+
+    def __init__(self, q: queue.Queue):
+        super().__init__(q)
+        self.dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: the listener thread formats the record, not the request thread.
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self.dropped += 1
+
+
+_listener: logging.handlers.QueueListener | None = None
+_queue_handler: DroppingQueueHandler | None = None
 
 
 def setup_logging(cfg: dict) -> logging.Logger:
+    global _listener, _queue_handler
+
     log_cfg = cfg["logging"]
     level = getattr(logging, str(log_cfg.get("level", "INFO")).upper(), logging.INFO)
 
@@ -19,7 +52,30 @@ def setup_logging(cfg: dict) -> logging.Logger:
     sh.setLevel(level)
     sh.setFormatter(fmt)
 
-    logger.addHandler(fh)
-    logger.addHandler(sh)
+    if log_cfg.get("mode", "sync") == "queue":
+        _queue_handler = DroppingQueueHandler(queue.Queue(maxsize=int(log_cfg.get("queue_size", 10000))))
+        _listener = logging.handlers.QueueListener(_queue_handler.queue, fh, sh, respect_handler_level=True)
+        _listener.start()
+        logger.addHandler(_queue_handler)
+    else:
+        logger.addHandler(fh)
+        logger.addHandler(sh)
     logger.propagate = False
-    return logger
\ No newline at end of file
+    return logger
+
+
+def stop_logging() -> None:
+    """Flushes what is still queued (queue mode)."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def dropped_log_records() -> int:
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def access_log_sampled(cfg: dict) -> bool:
+    rate = float(cfg["logging"]["access_sample_rate"])
+    return rate >= 1.0 or (rate > 0.0 and random.random() < rate)
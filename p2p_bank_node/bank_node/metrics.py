@@ -0,0 +1,194 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds of histogram buckets in milliseconds, the last bucket is +Inf.
+BUCKETS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
+
+# Label values can come from clients (the proxy target IP): each metric keeps at most this many
+# label sets, later ones are counted under OVERFLOW_LABEL so memory and output stay bounded.
+MAX_LABEL_SETS = 64
+OVERFLOW_LABEL = "other"
+
+# Histograms listed by MS; the reply has to fit one binary frame (u16 length).
+MAX_SUMMARY_ENTRIES = 24
+
+
+class Histogram:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        i = bisect.bisect_left(BUCKETS_MS, value_ms)
+        with self._lock:
+            self.counts[i] += 1
+            self.count += 1
+            self.sum += value_ms
+
+    def percentile(self, q: float) -> float:
+        """Estimate, linear interpolation inside the bucket that holds the q-th observation."""
+        with self._lock:
+            counts = list(self.counts)
+            total = self.count
+        if not total:
+            return 0.0
+        rank = q * total
+        seen = 0
+        for i, c in enumerate(counts):
+            if c and seen + c >= rank:
+                lower = BUCKETS_MS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS_MS[i] if i < len(BUCKETS_MS) else BUCKETS_MS[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return BUCKETS_MS[-1]
+
+
+def _key(name: str, labels: dict | None) -> tuple:
+    return name, tuple(sorted((labels or {}).items()))
+
+
+def _fmt_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class MetricsRegistry:
+    """Counters, gauges and latency histograms of the node. Names follow Prometheus conventions."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: dict[tuple, int] = {}
+        self._gauges: dict[tuple, float] = {}
+        self._gauge_fns: dict[tuple, callable] = {}
+        self._hists: dict[tuple, Histogram] = {}
+        self._label_sets: dict[str, set] = {}
+
+    def _bounded_key(self, name: str, labels: dict | None) -> tuple:
+        k = _key(name, labels)
+        if not k[1]:
+            return k
+        seen = self._label_sets.get(name)
+        if seen is not None and k[1] in seen:
+            return k
+        with self._lock:
+            seen = self._label_sets.setdefault(name, set())
+            if k[1] in seen:
+                return k
+            if len(seen) >= MAX_LABEL_SETS:
+                return name, tuple((label, OVERFLOW_LABEL) for label, _ in k[1])
+            seen.add(k[1])
+            return k
+
+    def inc(self, name: str, labels: dict | None = None, value: int = 1) -> None:
+        k = self._bounded_key(name, labels)
+        with self._lock:
+            self._counters[k] = self._counters.get(k, 0) + value
+
+    def add_gauge(self, name: str, delta: float, labels: dict | None = None) -> None:
+        k = self._bounded_key(name, labels)
+        with self._lock:
+            self._gauges[k] = self._gauges.get(k, 0) + delta
+
+    def gauge_fn(self, name: str, fn, labels: dict | None = None) -> None:
+        """Gauge computed when metrics are read."""
+        with self._lock:
+            self._gauge_fns[_key(name, labels)] = fn
+
+    def histogram(self, name: str, labels: dict | None = None) -> Histogram:
+        k = self._bounded_key(name, labels)
+        h = self._hists.get(k)
+        if h is None:
+            with self._lock:
+                h = self._hists.setdefault(k, Histogram())
+        return h
+
+    def observe(self, name: str, value_ms: float, labels: dict | None = None) -> None:
+        self.histogram(name, labels).observe(value_ms)
+
+    def counter_value(self, name: str, labels: dict | None = None) -> int:
+        return self._counters.get(_key(name, labels), 0)
+
+    def gauge_value(self, name: str, labels: dict | None = None) -> float:
+        k = _key(name, labels)
+        fn = self._gauge_fns.get(k)
+        return fn() if fn is not None else self._gauges.get(k, 0)
+
+    def render_prometheus(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            gauge_fns = dict(self._gauge_fns)
+            hists = dict(self._hists)
+        for k, fn in gauge_fns.items():
+            gauges[k] = fn()
+
+        out = []
+        for (name, labels), v in sorted(counters.items()):
+            out.append(f"bank_{name}{_fmt_labels(labels)} {v}")
+        for (name, labels), v in sorted(gauges.items()):
+            out.append(f"bank_{name}{_fmt_labels(labels)} {v}")
+        for (name, labels), h in sorted(hists.items()):
+            cumulative = 0
+            for i, c in enumerate(list(h.counts)):
+                cumulative += c
+                le = str(BUCKETS_MS[i]) if i < len(BUCKETS_MS) else "+Inf"
+                out.append(f"bank_{name}_bucket{_fmt_labels(labels, (('le', le),))} {cumulative}")
+            out.append(f"bank_{name}_sum{_fmt_labels(labels)} {h.sum:.3f}")
+            out.append(f"bank_{name}_count{_fmt_labels(labels)} {h.count}")
+        return "\n".join(out) + "\n"
+
+    def summary_line(self) -> str:
+        """One-line overview for the MS admin command."""
+        with self._lock:
+            hists = dict(self._hists)
+            rejected = sum(v for (name, _), v in self._counters.items() if name == "connections_rejected_total")
+        parts = [f"conn={int(self.gauge_value('active_connections'))}",
+                 f"queued={int(self.gauge_value('handler_queue_depth'))}", f"rejected={rejected}"]
+        # The busiest histograms, listed in name order.
+        shown = sorted(hists.items(), key=lambda kv: kv[1].count, reverse=True)[:MAX_SUMMARY_ENTRIES]
+        for (name, labels), h in sorted(shown, key=lambda kv: kv[0]):
+            label = ",".join(str(v) for _, v in labels)
+            title = f"{name}[{label}]" if label else name
+            extra = ""
+            if name == "command_latency_ms":
+                extra = f",err={self.counter_value('command_errors_total', dict(labels))}"
+            parts.append(
+                f"{title}=n={h.count}{extra},p50={h.percentile(0.5):.2f},"
+                f"p95={h.percentile(0.95):.2f},p99={h.percentile(0.99):.2f}"
+            )
+        if len(hists) > len(shown):
+            parts.append(f"more={len(hists) - len(shown)}")
+        return " ".join(parts)
+
+
+METRICS = MetricsRegistry()
+
+
+def start_metrics_http(host: str, port: int, logger) -> ThreadingHTTPServer:
+    """Prometheus text endpoint on GET /metrics, served from a daemon thread."""
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = METRICS.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            pass
+
+    srv = ThreadingHTTPServer((host, port), _Handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("metrics_http listening on %s:%s", host, port)
+    return srv
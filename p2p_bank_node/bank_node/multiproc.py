@@ -0,0 +1,171 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+
+from .bank import Bank, BankError, BatchError
+
+# Bank methods a worker may call on the state owner.
+_BANK_METHODS = ("create_account", "deposit", "withdraw", "balance", "remove", "total_amount", "number_of_clients",
+                "apply_batch", "replication_status", "promote")
+
+
+class RemoteBank:
+    """
+    Stand-in for Bank inside a worker process. Every call is forwarded to the state owner
+    over a small pool of authenticated local connections, so all mutations stay in one process.
+    """
+
+    def __init__(self, address, authkey: bytes, connections: int):
+        self._address = address
+        self._authkey = authkey
+        # None is a slot whose connection broke, it is reopened on its next use.
+        self._conns: queue.Queue = queue.Queue()
+        for _ in range(connections):
+            self._conns.put(Client(address, authkey=authkey))
+
+    def _call(self, method: str, *args):
+        conn = self._conns.get()
+        try:
+            if conn is None:
+                conn = Client(self._address, authkey=self._authkey)
+            conn.send((method, args))
+            status, value = conn.recv()
+        except BaseException:
+            # A failed send/recv leaves the stream out of step, never reuse the connection.
+            if conn is not None:
+                conn.close()
+            self._conns.put(None)
+            raise
+        self._conns.put(conn)
+        if status == "err":
+            raise BankError(value)
+        if status == "batch_err":
+            raise BatchError(*value)
+        return value
+
+    def create_account(self) -> int:
+        return self._call("create_account")
+
+    def deposit(self, acct: int, amount: int) -> None:
+        self._call("deposit", acct, amount)
+
+    def withdraw(self, acct: int, amount: int) -> None:
+        self._call("withdraw", acct, amount)
+
+    def balance(self, acct: int) -> int:
+        return self._call("balance", acct)
+
+    def remove(self, acct: int) -> None:
+        self._call("remove", acct)
+
+    def apply_batch(self, ops: list[tuple[str, int, int]]) -> list[int | None]:
+        return self._call("apply_batch", ops)
+
+    def replication_status(self) -> str:
+        return self._call("replication_status")
+
+    def promote(self) -> str:
+        return self._call("promote")
+
+    def total_amount(self) -> int:
+        return self._call("total_amount")
+
+    def number_of_clients(self) -> int:
+        return self._call("number_of_clients")
+
+
+def _serve_ipc_conn(conn, bank: Bank, logger):
+    try:
+        while True:
+            try:
+                method, args = conn.recv()
+            except (EOFError, OSError):
+                return
+            if method not in _BANK_METHODS:
+                conn.send(("err", "Nepovolený příkaz."))
+                continue
+            try:
+                conn.send(("ok", getattr(bank, method)(*args)))
+            except BatchError as e:
+                conn.send(("batch_err", (e.index, str(e))))
+            except BankError as e:
+                conn.send(("err", str(e)))
+            except Exception as e:
+                logger.exception("ipc_call_failed method=%s", method)
+                conn.send(("err", f"Chyba v aplikaci, prosím zkuste to později. ({e})"))
+    finally:
+        conn.close()
+
+
+def _serve_ipc(listener: Listener, bank: Bank, logger, closed: threading.Event):
+    while not closed.is_set():
+        try:
+            conn = listener.accept()
+        except (OSError, EOFError, AuthenticationError) as e:
+            # One bad handshake (wrong digest, peer hung up) must not stop the accept loop.
+            if not closed.is_set():
+                logger.warning("ipc_accept_failed error=%s", e)
+            continue
+        threading.Thread(target=_serve_ipc_conn, args=(conn, bank, logger), name="ipc-conn", daemon=True).start()
+
+
+def _watch_parent(parent_pid: int, logger):
+    # daemon=True only helps when the owner exits normally; after a SIGKILL the worker is reparented.
+    while os.getppid() == parent_pid:
+        time.sleep(1.0)
+    logger.error("owner_gone parent_pid=%s, worker exiting", parent_pid)
+    os._exit(1)
+
+
+def _worker_main(cfg: dict, address, authkey: bytes, index: int, parent_pid: int):
+    from .logging_setup import setup_logging
+    from .server import serve_clients
+
+    logger = setup_logging(cfg)
+    threading.Thread(target=_watch_parent, args=(parent_pid, logger), name="parent-watch", daemon=True).start()
+    bank = RemoteBank(address, authkey, int(cfg["server"]["ipc_connections_per_worker"]))
+    logger.info("worker_started index=%s pid=%s", index, os.getpid())
+    serve_clients(cfg, bank, logger, reuse_port=True)
+
+
+def run_multiprocess(cfg: dict, bank: Bank, logger):
+    """
+    The calling process owns the accounts (Bank, storage, snapshots) and serves them over IPC.
+    server.workers processes bind the client port with SO_REUSEPORT, the kernel spreads
+    connections between them; they parse, validate and proxy in parallel.
+    """
+    authkey = os.urandom(32)
+    listener = Listener(("127.0.0.1", 0), authkey=authkey)
+    closed = threading.Event()
+    threading.Thread(target=_serve_ipc, args=(listener, bank, logger, closed), name="ipc-accept", daemon=True).start()
+
+    # spawn: forking a process that already runs threads (flusher, snapshots, logging) is unsafe.
+    ctx = multiprocessing.get_context("spawn")
+    owner_pid = os.getpid()
+    workers = {}
+
+    def start_worker(i: int):
+        p = ctx.Process(target=_worker_main, args=(cfg, listener.address, authkey, i, owner_pid),
+                        name=f"bank-worker-{i}", daemon=True)
+        p.start()
+        workers[i] = p
+
+    for i in range(int(cfg["server"]["workers"])):
+        start_worker(i)
+
+    try:
+        while True:
+            time.sleep(1.0)
+            for i, p in list(workers.items()):
+                if not p.is_alive():
+                    logger.error("worker_died index=%s exitcode=%s, restarting", i, p.exitcode)
+                    start_worker(i)
+    finally:
+        for p in workers.values():
+            p.terminate()
+        closed.set()
+        listener.close()
@@ -0,0 +1,130 @@
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from .metrics import METRICS
+
+MAX_STACK_DEPTH = 128
+
+# handler-12, ThreadPoolExecutor-0_3 -> one flame graph root per kind of thread
+_THREAD_NUM_RE = re.compile(r"([-_]\d+)+$")
+
+
+def _frame_name(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class Profiler:
+    """
+    Opt-in sampling profiler of one node process, switched at runtime (PF command, SIGUSR2).
+
+    While on, a daemon thread takes the stacks of all other threads sample_hz times a second
+    and counts them as collapsed stacks (thread;outer;...;inner), the format flamegraph.pl and
+    speedscope read. Call sites also report per-command phases into phase_ms{phase=...}.
+    Off, a phase report is a single attribute check and nothing samples.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.sample_hz = 100.0
+        self.out_dir = "logs/profiles"
+        # RLock: the SIGUSR2 handler may interrupt a PF command of the main thread.
+        self._lock = threading.RLock()
+        self._stacks: Counter = Counter()
+        self._samples = 0
+        self._dumps = 0
+        self._started_at = 0.0
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def configure(self, cfg: dict) -> None:
+        prof = cfg["profiler"]
+        self.sample_hz = float(prof["sample_hz"])
+        self.out_dir = prof["out_dir"]
+        if prof["enabled"] and not self.enabled:
+            self.start()
+
+    def phase(self, name: str, started: float) -> None:
+        if self.enabled:
+            METRICS.observe("phase_ms", (time.perf_counter() - started) * 1000, {"phase": name})
+
+    def start(self) -> str:
+        with self._lock:
+            if not self.enabled:
+                self._stacks = Counter()
+                self._samples = 0
+                self._started_at = time.monotonic()
+                self._stop = threading.Event()
+                self._thread = threading.Thread(target=self._sample_loop, args=(self._stop,), name="profiler",
+                                                daemon=True)
+                self._thread.start()
+                self.enabled = True
+        return self.status()
+
+    def stop(self) -> str:
+        """Stops sampling and writes what was collected. Returns the dump path."""
+        with self._lock:
+            if not self.enabled:
+                return self.status()
+            self.enabled = False
+            self._stop.set()
+            thread = self._thread
+        thread.join()
+        return f"off samples={self._samples} file={self.dump()}"
+
+    def toggle(self) -> str:
+        return self.stop() if self.enabled else self.start()
+
+    def status(self) -> str:
+        if not self.enabled:
+            return f"off samples={self._samples}"
+        return (f"on sample_hz={self.sample_hz:g} samples={self._samples} "
+                f"sec={time.monotonic() - self._started_at:.1f}")
+
+    def dump(self) -> str:
+        """Writes the collapsed stacks collected so far (sampling goes on when on)."""
+        with self._lock:
+            stacks = dict(self._stacks)
+            self._dumps += 1
+            n = self._dumps
+        os.makedirs(self.out_dir, exist_ok=True)
+        path = os.path.join(self.out_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}-{n}.folded")
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def command(self, action: str) -> str:
+        """PF ON | OFF | DUMP | STATUS"""
+        if action == "ON":
+            return self.start()
+        if action == "OFF":
+            return self.stop()
+        if action == "DUMP":
+            return f"{self.status()} file={self.dump()}"
+        return self.status()
+
+    def _sample_loop(self, stop: threading.Event) -> None:
+        own = threading.get_ident()
+        interval = 1.0 / self.sample_hz
+        while not stop.wait(interval):
+            names = {t.ident: _THREAD_NUM_RE.sub("", t.name) for t in threading.enumerate()}
+            sample = []
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_STACK_DEPTH:
+                    stack.append(_frame_name(frame.f_code))
+                    frame = frame.f_back
+                stack.append(names.get(ident, "thread"))
+                sample.append(";".join(reversed(stack)))
+            with self._lock:
+                self._stacks.update(sample)
+                self._samples += 1
+
+
+PROFILER = Profiler()
@@ -37,33 +37,76 @@ def parse_command(line: str) -> tuple[str, list[str]]:
     return code, args
 
 
-def validate_and_normalize(code: str, args: list[str]) -> dict:
-    if code == "BC":
-        if args:
-            raise ProtocolError("BC nemá argumenty.")
-        return {"code": "BC"}
+# Arguments of every command, in order. "account" is <account>/<ip>, "amount" is <number>,
+# "action" is one of PROFILER_ACTIONS (any case).
+COMMAND_ARGS = {
+    "BC": (),
+    "AC": (),
+    "AD": ("account", "amount"),
+    "AW": ("account", "amount"),
+    "AB": ("account",),
+    "AR": ("account",),
+    "BA": (),
+    "BN": (),
+    "MS": (),
+    "BP": (),
+    "RS": (),
+    "RP": (),
+    "NA": (),
+    "NN": (),
+    "PF": ("action",),
+}
+
+PROFILER_ACTIONS = ("ON", "OFF", "DUMP", "STATUS")
+
+
+# BT <op>;<op>;... carries up to BATCH_MAX_OPS of these commands.
+BATCH_CODES = ("AD", "AW", "AB")
+BATCH_MAX_OPS = 1000
+
+
+def _parse_batch(args: list[str]) -> dict:
+    entries = [e.strip() for e in " ".join(args).split(";")]
+    if entries and not entries[-1]:
+        entries.pop()
+    if not entries:
+        raise ProtocolError("Dávka je prázdná.")
+    if len(entries) > BATCH_MAX_OPS:
+        raise ProtocolError(f"Dávka může mít nejvýš {BATCH_MAX_OPS} operací.")
+
+    ops = []
+    for i, entry in enumerate(entries, start=1):
+        try:
+            code, op_args = parse_command(entry)
+            if code not in BATCH_CODES:
+                raise ProtocolError("Nepovolený příkaz.")
+            ops.append(validate_and_normalize(code, op_args))
+        except ProtocolError as e:
+            raise ProtocolError(f"Operace {i}: {e}")
+    return {"code": "BT", "ops": ops}
 
-    if code == "AC":
-        if args:
-            raise ProtocolError("AC nemá argumenty.")
-        return {"code": "AC"}
-
-    if code in ("AD", "AW"):
-        if len(args) != 2:
-            raise ProtocolError("Špatný počet argumentů.")
-        acct, ip = _parse_account_bank(args[0])
-        amount = _parse_amount(args[1])
-        return {"code": code, "account": acct, "bank_ip": ip, "amount": amount}
-
-    if code in ("AB", "AR"):
-        if len(args) != 1:
-            raise ProtocolError("Špatný počet argumentů.")
-        acct, ip = _parse_account_bank(args[0])
-        return {"code": code, "account": acct, "bank_ip": ip}
-
-    if code in ("BA", "BN"):
+
+def validate_and_normalize(code: str, args: list[str]) -> dict:
+    if code == "BT":
+        return _parse_batch(args)
+    spec = COMMAND_ARGS.get(code)
+    if spec is None:
+        raise ProtocolError("Nepovolený příkaz.")
+    if not spec:
         if args:
             raise ProtocolError(f"{code} nemá argumenty.")
         return {"code": code}
-
-    raise ProtocolError("Nepovolený příkaz.")
\ No newline at end of file
+    if len(args) != len(spec):
+        raise ProtocolError("Špatný počet argumentů.")
+
+    cmd = {"code": code}
+    for kind, token in zip(spec, args):
+        if kind == "account":
+            cmd["account"], cmd["bank_ip"] = _parse_account_bank(token)
+        elif kind == "action":
+            cmd["action"] = token.upper()
+            if cmd["action"] not in PROFILER_ACTIONS:
+                raise ProtocolError(f"Akce musí být jedna z: {', '.join(PROFILER_ACTIONS)}.")
+        else:
+            cmd["amount"] = _parse_amount(token)
+    return cmd
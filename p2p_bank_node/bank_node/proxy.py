@@ -1,28 +1,483 @@
+import asyncio
+import select
 import socket
+import threading
+import time
+
+from .metrics import METRICS
 
 
 class ProxyError(Exception):
     pass
 
 
-def forward_command(target_ip: str, target_port: int, line: str, timeout_sec: float) -> str:
+class ProxyConnectError(ProxyError):
+    """The peer could not be reached at all (refused, unreachable, connect timeout)."""
+
+
+class PeerUnavailableError(ProxyError):
+    """Rejected without a network call, the peer's circuit is open or its IP is negatively cached."""
+
+
+class LocalOverloadError(ProxyError):
+    """This node has no free connection slot for the peer; says nothing about the peer's health."""
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class _PeerHealth:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.unreachable_until = 0.0
+        self.last_error = ""
+
+
+class PeerRegistry:
+    """
+    Health of every peer bank this node proxies to.
+
+    After failure_threshold consecutive failures the peer's circuit opens and commands for it
+    fail immediately. After open_sec one command is let through as a probe (half-open):
+    success closes the circuit, failure opens it again. Independently, a failed connect marks
+    the IP unreachable for negative_cache_sec.
+    """
+
+    def __init__(self, failure_threshold: int, open_sec: float, negative_cache_sec: float):
+        self.failure_threshold = failure_threshold
+        self.open_sec = open_sec
+        self.negative_cache_sec = negative_cache_sec
+        self._lock = threading.Lock()
+        self._peers: dict[str, _PeerHealth] = {}
+
+    def _peer(self, target_ip: str) -> _PeerHealth:
+        peer = self._peers.get(target_ip)
+        if peer is None:
+            peer = _PeerHealth()
+            self._peers[target_ip] = peer
+        return peer
+
+    def before_call(self, target_ip: str) -> bool:
+        """Raises PeerUnavailableError when the call must not go out. True when the call is the half-open probe."""
+        now = time.monotonic()
+        with self._lock:
+            peer = self._peer(target_ip)
+            if peer.state == CLOSED:
+                if now < peer.unreachable_until:
+                    self._reject(target_ip, "Cílová banka je nedostupná.")
+                return False
+            if peer.state == OPEN and now - peer.opened_at >= self.open_sec:
+                peer.state = HALF_OPEN
+                peer.probe_in_flight = False
+            if peer.state == HALF_OPEN and not peer.probe_in_flight:
+                peer.probe_in_flight = True
+                return True
+        self._reject(target_ip, "Cílová banka je dočasně vyřazena po opakovaných chybách.")
+
+    def _reject(self, target_ip: str, msg: str):
+        METRICS.inc("proxy_rejected_total", {"peer": target_ip})
+        raise PeerUnavailableError(msg)
+
+    def record_success(self, target_ip: str) -> None:
+        with self._lock:
+            peer = self._peer(target_ip)
+            peer.state = CLOSED
+            peer.failures = 0
+            peer.probe_in_flight = False
+            peer.unreachable_until = 0.0
+
+    def record_failure(self, target_ip: str, error: ProxyError) -> None:
+        now = time.monotonic()
+        with self._lock:
+            peer = self._peer(target_ip)
+            peer.failures += 1
+            peer.last_error = str(error)
+            peer.probe_in_flight = False
+            if isinstance(error, ProxyConnectError):
+                peer.unreachable_until = now + self.negative_cache_sec
+            if peer.state == HALF_OPEN or peer.failures >= self.failure_threshold:
+                if peer.state != OPEN:
+                    METRICS.inc("proxy_circuit_opened_total", {"peer": target_ip})
+                peer.state = OPEN
+                peer.opened_at = now
+
+    def _end_probe(self, target_ip: str) -> None:
+        # The probe ended without a verdict (local overload, cancel, bug): let the next command probe.
+        with self._lock:
+            peer = self._peer(target_ip)
+            if peer.state == HALF_OPEN:
+                peer.probe_in_flight = False
+
+    def call(self, target_ip: str, fn, *args) -> str:
+        """Runs fn(*args) under the breaker of target_ip."""
+        probe = self.before_call(target_ip)
+        try:
+            resp = fn(*args)
+        except LocalOverloadError:
+            raise
+        except ProxyError as e:
+            self.record_failure(target_ip, e)
+            raise
+        else:
+            self.record_success(target_ip)
+            return resp
+        finally:
+            if probe:
+                self._end_probe(target_ip)
+
+    async def call_async(self, target_ip: str, coro_fn, *args) -> str:
+        probe = self.before_call(target_ip)
+        try:
+            resp = await coro_fn(*args)
+        except LocalOverloadError:
+            raise
+        except ProxyError as e:
+            self.record_failure(target_ip, e)
+            raise
+        else:
+            self.record_success(target_ip)
+            return resp
+        finally:
+            if probe:
+                self._end_probe(target_ip)
+
+    def open_circuits(self) -> int:
+        with self._lock:
+            return sum(1 for p in self._peers.values() if p.state != CLOSED)
+
+    def describe(self) -> dict[str, dict]:
+        with self._lock:
+            return {ip: {"state": p.state, "failures": p.failures, "last_error": p.last_error}
+                    for ip, p in self._peers.items()}
+
+
+class _Flight:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: str | None = None
+        self.error: ProxyError | None = None
+
+
+class ReadCoalescer:
+    """
+    Single-flight for read-only proxied commands: concurrent calls with the same key share
+    one upstream request and all get its reply. With cache_ttl_sec > 0 successful replies are
+    also reused for that long (stale by at most the TTL).
+    """
+
+    MAX_CACHE_ENTRIES = 10000
+
+    def __init__(self, cache_ttl_sec: float):
+        self.cache_ttl_sec = cache_ttl_sec
+        self._lock = threading.Lock()
+        self._flights: dict[str, _Flight] = {}
+        self._futures: dict[str, asyncio.Future] = {}
+        self._cache: dict[str, tuple[float, str]] = {}
+
+    def _cached(self, key: str) -> str | None:
+        if self.cache_ttl_sec <= 0:
+            return None
+        entry = self._cache.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        METRICS.inc("proxy_read_cache_hits_total")
+        return entry[1]
+
+    def _store(self, key: str, resp: str) -> None:
+        if self.cache_ttl_sec <= 0 or resp.startswith("ER"):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if len(self._cache) >= self.MAX_CACHE_ENTRIES:
+                self._cache = {k: v for k, v in self._cache.items() if v[0] >= now}
+                if len(self._cache) >= self.MAX_CACHE_ENTRIES:
+                    self._cache.clear()
+            self._cache[key] = (now + self.cache_ttl_sec, resp)
+
+    def call(self, key: str, fn, *args) -> str:
+        resp = self._cached(key)
+        if resp is not None:
+            return resp
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._flights[key] = flight
+
+        if not leader:
+            METRICS.inc("proxy_coalesced_total")
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = fn(*args)
+            self._store(key, flight.result)
+            return flight.result
+        except ProxyError as e:
+            flight.error = e
+            raise
+        except Exception as e:
+            flight.error = ProxyError(str(e))
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    async def call_async(self, key: str, coro_fn, *args) -> str:
+        """Same for the asyncio engine (one event loop, so no lock is needed for the futures)."""
+        resp = self._cached(key)
+        if resp is not None:
+            return resp
+
+        fut = self._futures.get(key)
+        if fut is not None:
+            METRICS.inc("proxy_coalesced_total")
+            return await asyncio.shield(fut)
+
+        fut = asyncio.get_running_loop().create_future()
+        self._futures[key] = fut
+        try:
+            resp = await coro_fn(*args)
+            self._store(key, resp)
+            fut.set_result(resp)
+            return resp
+        except BaseException as e:
+            fut.set_exception(e if isinstance(e, ProxyError) else ProxyError(str(e) or type(e).__name__))
+            # Mark the exception as retrieved when nobody else was waiting.
+            fut.exception()
+            raise
+        finally:
+            del self._futures[key]
+
+
+def build_read_coalescer(cfg: dict) -> ReadCoalescer | None:
+    proxy = cfg["proxy"]
+    if not proxy["coalesce_reads"]:
+        return None
+    return ReadCoalescer(float(proxy["read_cache_ttl_sec"]))
+
+
+def build_peer_registry(cfg: dict) -> PeerRegistry:
+    proxy = cfg["proxy"]
+    return PeerRegistry(
+        failure_threshold=int(proxy["breaker_failure_threshold"]),
+        open_sec=float(proxy["breaker_open_sec"]),
+        negative_cache_sec=float(proxy["negative_cache_sec"]),
+    )
+
+
+def _connect(target_ip: str, target_port: int, connect_timeout_sec: float) -> socket.socket:
+    try:
+        return socket.create_connection((target_ip, target_port), timeout=connect_timeout_sec)
+    except (socket.timeout, TimeoutError):
+        raise ProxyConnectError("Timeout při připojování na cílovou banku.")
+    except OSError as e:
+        raise ProxyConnectError(f"Nelze se připojit na cílovou banku: {e}")
+
+
+def forward_command(target_ip: str, target_port: int, line: str, timeout_sec: float,
+                    connect_timeout_sec: float | None = None) -> str:
+    """timeout_sec limits every read/write, connect_timeout_sec (default timeout_sec) only the connect."""
+    return forward_commands(target_ip, target_port, [line], timeout_sec, connect_timeout_sec)[0]
+
+
+def forward_commands(target_ip: str, target_port: int, lines: list[str], timeout_sec: float,
+                     connect_timeout_sec: float | None = None) -> list[str]:
+    """Sends all lines pipelined over one connection, returns one reply per line."""
+    sock = _connect(target_ip, target_port, connect_timeout_sec or timeout_sec)
     try:
-        with socket.create_connection((target_ip, target_port), timeout=timeout_sec) as s:
+        with sock as s, s.makefile("rb") as rfile:
             s.settimeout(timeout_sec)
-            s.sendall(line.encode("utf-8") + b"\n")
+            s.sendall(b"".join(line.encode("utf-8") + b"\n" for line in lines))
+            return [_read_reply(rfile) for _ in lines]
+
+    except ProxyError:
+        raise
+    except (socket.timeout, TimeoutError):
+        raise ProxyError("Timeout při komunikaci s cílovou bankou.")
+    except OSError as e:
+        raise ProxyError(f"Nelze se připojit na cílovou banku: {e}")
+
+
+def _read_reply(rfile) -> str:
+    data = rfile.readline()
+    if not data:
+        raise ProxyError("Cílová banka neodpověděla.")
+    return data.decode("utf-8", errors="replace").strip()
+
+
+class _PeerConn:
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.rfile = sock.makefile("rb")
+        self.last_used = time.monotonic()
 
-            data = b""
-            while not data.endswith(b"\n"):
-                chunk = s.recv(4096)
-                if not chunk:
-                    break
-                data += chunk
+    def is_healthy(self, idle_ttl_sec: float) -> bool:
+        if time.monotonic() - self.last_used > idle_ttl_sec:
+            return False
+        # An idle connection must have nothing to read; readable means EOF (peer closed it) or garbage.
+        try:
+            readable, _, _ = select.select([self.sock], [], [], 0)
+        except (OSError, ValueError):
+            return False
+        return not readable
 
+    def close(self):
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class PeerPool:
+    """
+    Keeps connections to peer banks open and reuses them for further proxied commands.
+    At most max_per_peer commands run against one peer at a time, the rest wait for a free slot.
+    Idle connections are dropped after idle_ttl_sec, keep it below the peers' client_idle_timeout_sec.
+    """
+
+    def __init__(self, port: int, timeout_sec: float, max_per_peer: int, idle_ttl_sec: float,
+                 connect_timeout_sec: float | None = None):
+        self.port = port
+        self.timeout_sec = timeout_sec
+        self.connect_timeout_sec = connect_timeout_sec or timeout_sec
+        self.max_per_peer = max_per_peer
+        self.idle_ttl_sec = idle_ttl_sec
+        self._lock = threading.Lock()
+        self._idle: dict[str, list[_PeerConn]] = {}
+        self._slots: dict[str, threading.BoundedSemaphore] = {}
+
+    def _slots_for(self, target_ip: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            slots = self._slots.get(target_ip)
+            if slots is None:
+                slots = threading.BoundedSemaphore(self.max_per_peer)
+                self._slots[target_ip] = slots
+            return slots
+
+    def _checkout(self, target_ip: str) -> _PeerConn | None:
+        while True:
+            with self._lock:
+                idle = self._idle.get(target_ip)
+                if not idle:
+                    return None
+                conn = idle.pop()
+            if conn.is_healthy(self.idle_ttl_sec):
+                return conn
+            conn.close()
+
+    def _checkin(self, target_ip: str, conn: _PeerConn):
+        conn.last_used = time.monotonic()
+        with self._lock:
+            self._idle.setdefault(target_ip, []).append(conn)
+
+    def _connect(self, target_ip: str) -> _PeerConn:
+        sock = _connect(target_ip, self.port, self.connect_timeout_sec)
+        sock.settimeout(self.timeout_sec)
+        return _PeerConn(sock)
+
+    def forward(self, target_ip: str, line: str) -> str:
+        return self.forward_many(target_ip, [line])[0]
+
+    def forward_many(self, target_ip: str, lines: list[str]) -> list[str]:
+        """Sends the lines pipelined over one pooled connection, returns one reply per line."""
+        slots = self._slots_for(target_ip)
+        if not slots.acquire(timeout=self.timeout_sec):
+            raise LocalOverloadError("Příliš mnoho souběžných požadavků na cílovou banku.")
+
+        conn = None
+        data = b"".join(line.encode("utf-8") + b"\n" for line in lines)
+        try:
+            conn = self._checkout(target_ip)
+            if conn is not None:
+                try:
+                    conn.sock.sendall(data)
+                except OSError:
+                    # Stale keep-alive socket, the command was not delivered -> reconnect.
+                    conn.close()
+                    conn = None
+            if conn is None:
+                conn = self._connect(target_ip)
+                conn.sock.sendall(data)
+
+            replies = []
+            for _ in lines:
+                resp = conn.rfile.readline()
+                if not resp:
+                    raise ProxyError("Cílová banka neodpověděla.")
+                replies.append(resp)
+            if replies[-1].endswith(b"\n"):
+                self._checkin(target_ip, conn)
+            else:
+                conn.close()
+            conn = None
+            return [resp.decode("utf-8", errors="replace").strip() for resp in replies]
+
+        except ProxyError:
+            raise
+        except (socket.timeout, TimeoutError):
+            raise ProxyError("Timeout při komunikaci s cílovou bankou.")
+        except OSError as e:
+            raise ProxyError(f"Nelze se připojit na cílovou banku: {e}")
+        finally:
+            if conn is not None:
+                conn.close()
+            slots.release()
+
+    def close(self):
+        with self._lock:
+            idle = [c for conns in self._idle.values() for c in conns]
+            self._idle.clear()
+        for conn in idle:
+            conn.close()
+
+
+async def forward_command_async(target_ip: str, target_port: int, line: str, timeout_sec: float,
+                                connect_timeout_sec: float | None = None) -> str:
+    return (await forward_commands_async(target_ip, target_port, [line], timeout_sec, connect_timeout_sec))[0]
+
+
+async def forward_commands_async(target_ip: str, target_port: int, lines: list[str], timeout_sec: float,
+                                 connect_timeout_sec: float | None = None) -> list[str]:
+    writer = None
+    try:
+        try:
+            reader, writer = await asyncio.wait_for(asyncio.open_connection(target_ip, target_port),
+                                                    connect_timeout_sec or timeout_sec)
+        except (asyncio.TimeoutError, TimeoutError):
+            raise ProxyConnectError("Timeout při připojování na cílovou banku.")
+        except OSError as e:
+            raise ProxyConnectError(f"Nelze se připojit na cílovou banku: {e}")
+        writer.write(b"".join(line.encode("utf-8") + b"\n" for line in lines))
+        await asyncio.wait_for(writer.drain(), timeout_sec)
+
+        replies = []
+        for _ in lines:
+            data = await asyncio.wait_for(reader.readline(), timeout_sec)
             if not data:
                 raise ProxyError("Cílová banka neodpověděla.")
-            return data.decode("utf-8", errors="replace").strip()
+            replies.append(data.decode("utf-8", errors="replace").strip())
+        return replies
 
-    except (socket.timeout, TimeoutError):
+    except ProxyError:
+        raise
+    except (asyncio.TimeoutError, TimeoutError):
         raise ProxyError("Timeout při komunikaci s cílovou bankou.")
     except OSError as e:
-        raise ProxyError(f"Nelze se připojit na cílovou banku: {e}")
\ No newline at end of file
+        raise ProxyError(f"Nelze se připojit na cílovou banku: {e}")
+    finally:
+        if writer is not None:
+            writer.close()
@@ -0,0 +1,300 @@
+import json
+import os
+import socket
+import threading
+import time
+
+from .metrics import METRICS
+
+HEARTBEAT_SEC = 1.0
+RECONNECT_SEC = 1.0
+
+
+class ReplicationError(Exception):
+    pass
+
+
+def _send(sock: socket.socket, msg: dict) -> None:
+    sock.sendall(json.dumps(msg, separators=(",", ":")).encode("utf-8") + b"\n")
+
+
+def _changes(records: list[dict]) -> dict[int, int | None]:
+    """Storage records (set/del/batch) -> {account: balance or None for a removed account}."""
+    out: dict[int, int | None] = {}
+    for rec in records:
+        if rec["op"] == "batch":
+            out.update(_changes(rec["ops"]))
+        elif rec["op"] == "set":
+            out[int(rec["acct"])] = int(rec["bal"])
+        else:
+            out[int(rec["acct"])] = None
+    return out
+
+
+class ReplicationFeed:
+    """
+    Ordered feed of committed mutations on the primary.
+
+    Bank publishes under the account's stripe lock, so the sequence numbers follow the order
+    of changes of every single account, and confirms each record once it is on disk. Followers
+    see records only up to seq, the end of the confirmed prefix. The last backlog_ops records are kept in memory;
+    a follower that asks for anything older gets a full snapshot first.
+    feed_id identifies this history, sequence numbers of another primary are meaningless.
+    """
+
+    def __init__(self, backlog_ops: int, first_seq: int = 0):
+        self.feed_id = os.urandom(8).hex()
+        self.backlog_ops = backlog_ops
+        self._cond = threading.Condition()
+        self._records: list[dict] = []
+        self._first_seq = first_seq + 1
+        self.seq = first_seq          # last confirmed record, the head followers see
+        self._last = first_seq        # last published record
+        self._confirmed: set[int] = set()
+
+    def publish(self, record: dict) -> int:
+        """Appends a record that followers get after confirm(). Returns its sequence number."""
+        with self._cond:
+            self._records.append(record)
+            self._last += 1
+            if len(self._records) > 2 * self.backlog_ops:
+                drop = min(len(self._records) - self.backlog_ops, self.seq - self._first_seq + 1)
+                del self._records[:drop]
+                self._first_seq += drop
+            return self._last
+
+    def confirm(self, seq: int) -> None:
+        with self._cond:
+            self._confirmed.add(seq)
+            advanced = False
+            while self.seq + 1 in self._confirmed:
+                self._confirmed.discard(self.seq + 1)
+                self.seq += 1
+                advanced = True
+            if advanced:
+                self._cond.notify_all()
+
+    def wait_confirmed(self) -> None:
+        """Waits until every published record is confirmed. The caller must stop new publishes."""
+        with self._cond:
+            while self.seq < self._last:
+                self._cond.wait()
+
+    def read_after(self, seq: int, timeout: float) -> tuple[int, list[dict]] | None:
+        """Records after seq (waits up to timeout for some). None when seq fell out of the backlog."""
+        with self._cond:
+            if seq < self._first_seq - 1 or seq > self.seq:
+                return None
+            if seq == self.seq:
+                self._cond.wait(timeout)
+                if seq < self._first_seq - 1:
+                    return None
+            start = seq - self._first_seq + 1
+            return self.seq, self._records[start:self.seq - self._first_seq + 1]
+
+
+class ReplicationPrimary:
+    """Accepts followers on host:port and streams the feed to each of them from its own thread."""
+
+    def __init__(self, bank, feed: ReplicationFeed, host: str, port: int, logger):
+        self.bank = bank
+        self.feed = feed
+        self.logger = logger
+        self._followers = 0
+        self._lock = threading.Lock()
+        self._srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._srv.bind((host, port))
+        self._srv.listen(16)
+        METRICS.gauge_fn("replication_followers", lambda: self._followers)
+        METRICS.gauge_fn("replication_seq", lambda: self.feed.seq)
+        threading.Thread(target=self._accept_loop, name="repl-accept", daemon=True).start()
+
+    def _accept_loop(self):
+        while True:
+            try:
+                conn, addr = self._srv.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(conn, addr), name="repl-follower", daemon=True).start()
+
+    def _serve(self, conn: socket.socket, addr):
+        with self._lock:
+            self._followers += 1
+        try:
+            conn.settimeout(10.0)
+            hello = json.loads(conn.makefile("rb").readline() or b"{}")
+            conn.settimeout(None)
+            seq = int(hello.get("from", 0)) if hello.get("feed_id") == self.feed.feed_id else -1
+            self.logger.info("replication_follower_connected follower=%s:%s from=%s", addr[0], addr[1], seq)
+
+            while True:
+                batch = self.feed.read_after(seq, HEARTBEAT_SEC) if seq >= 0 else None
+                if batch is None:
+                    seq, accounts = self.bank.replication_snapshot()
+                    _send(conn, {"type": "snapshot", "feed_id": self.feed.feed_id, "seq": seq, "head": self.feed.seq,
+                                 "accounts": {str(k): v for k, v in accounts.items()}})
+                    continue
+                last, records = batch
+                # head: newest seq at send time, lets the follower see how far behind it is.
+                if records:
+                    _send(conn, {"type": "ops", "seq": last, "head": self.feed.seq, "recs": records})
+                else:
+                    _send(conn, {"type": "hb", "seq": last, "head": self.feed.seq})
+                seq = last
+        except (OSError, ValueError) as e:
+            self.logger.info('replication_follower_closed follower=%s:%s error="%s"', addr[0], addr[1], e)
+        finally:
+            with self._lock:
+                self._followers -= 1
+            conn.close()
+
+    def status(self) -> str:
+        return f"primary seq={self.feed.seq} followers={self._followers}"
+
+    def close(self):
+        self._srv.close()
+
+
+class ReplicationFollower:
+    """
+    Keeps the local Bank in sync with a primary. Runs until promote() or close().
+    Lag: lag_ops = newest primary seq seen - applied seq, lag_ms = time since the follower was last
+    known to be caught up (0 while the heartbeats confirm it). Only the local clock is used.
+    """
+
+    def __init__(self, bank, primary_host: str, primary_port: int, logger):
+        self.bank = bank
+        self.primary_host = primary_host
+        self.primary_port = primary_port
+        self.logger = logger
+        self.feed_id = None
+        self.applied_seq = 0
+        self.primary_seq = 0
+        self.connected = False
+        self._synced_at: float | None = None
+        self._stop = threading.Event()
+        self._sock: socket.socket | None = None
+        METRICS.gauge_fn("replication_lag_ops", self.lag_ops)
+        METRICS.gauge_fn("replication_lag_ms", self.lag_ms)
+        METRICS.gauge_fn("replication_connected", lambda: int(self.connected))
+        self._thread = threading.Thread(target=self._run, name="repl-follower", daemon=True)
+        self._thread.start()
+
+    def lag_ops(self) -> int:
+        return max(0, self.primary_seq - self.applied_seq)
+
+    def lag_ms(self) -> float:
+        synced = self._synced_at
+        if synced is None:
+            return 0.0
+        age = time.monotonic() - synced
+        if self.connected and self.applied_seq >= self.primary_seq and age <= 2 * HEARTBEAT_SEC:
+            return 0.0
+        return age * 1000
+
+    def _track_lag(self, head: int):
+        self.primary_seq = head
+        if self.applied_seq >= head:
+            self._synced_at = time.monotonic()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._follow()
+            except Exception as e:
+                if not self._stop.is_set():
+                    self.logger.warning('replication_disconnected primary=%s:%s error="%s"',
+                                        self.primary_host, self.primary_port, e)
+            self.connected = False
+            self._stop.wait(RECONNECT_SEC)
+
+    def _follow(self):
+        sock = socket.create_connection((self.primary_host, self.primary_port), timeout=5.0)
+        self._sock = sock
+        with sock, sock.makefile("rb") as rfile:
+            # No message for 3 heartbeats = dead primary.
+            sock.settimeout(3 * HEARTBEAT_SEC + 5.0)
+            _send(sock, {"from": self.applied_seq, "feed_id": self.feed_id})
+            self.connected = True
+            self.logger.info("replication_connected primary=%s:%s from=%s",
+                             self.primary_host, self.primary_port, self.applied_seq)
+            while not self._stop.is_set():
+                raw = rfile.readline()
+                if not raw:
+                    raise ReplicationError("primary closed the connection")
+                msg = json.loads(raw)
+                if self._stop.is_set():
+                    return
+                if msg["type"] == "snapshot":
+                    self.bank.apply_replica_snapshot({int(k): int(v) for k, v in msg["accounts"].items()})
+                    self.feed_id = msg["feed_id"]
+                    self.applied_seq = int(msg["seq"])
+                    self.logger.info("replication_snapshot_applied seq=%s accounts=%d",
+                                     self.applied_seq, len(msg["accounts"]))
+                elif msg["type"] == "ops":
+                    self.bank.apply_replicated(_changes(msg["recs"]))
+                    self.applied_seq = int(msg["seq"])
+                self._track_lag(int(msg["head"]))
+
+    def status(self) -> str:
+        return (f"follower primary={self.primary_host}:{self.primary_port} connected={int(self.connected)} "
+                f"seq={self.applied_seq} lag_ops={self.lag_ops()} lag_ms={self.lag_ms():.1f}")
+
+    def close(self):
+        self._stop.set()
+        sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self._thread.join()
+
+
+class Replication:
+    """Role of this node (primary / follower) and the switch between them (promote)."""
+
+    def __init__(self, cfg: dict, bank, logger):
+        self.cfg = cfg
+        self.bank = bank
+        self.logger = logger
+        self._lock = threading.Lock()
+        self.primary: ReplicationPrimary | None = None
+        self.follower: ReplicationFollower | None = None
+
+        rep = cfg["replication"]
+        if rep["role"] == "follower":
+            host, _, port = rep["primary"].rpartition(":")
+            bank.read_only = True
+            self.follower = ReplicationFollower(bank, host, int(port), logger)
+        else:
+            self._start_primary(first_seq=0)
+
+    def _start_primary(self, first_seq: int):
+        rep = self.cfg["replication"]
+        if rep["port"]:
+            # Without a port there is no reader, so no feed to keep in memory.
+            feed = ReplicationFeed(int(rep["backlog_ops"]), first_seq=first_seq)
+            self.bank.feed = feed
+            self.primary = ReplicationPrimary(self.bank, feed, self.cfg["bank"]["ip"], int(rep["port"]), self.logger)
+
+    def status(self) -> str:
+        if self.follower is not None:
+            return self.follower.status()
+        if self.primary is not None:
+            return self.primary.status()
+        return "primary followers=0"
+
+    def promote(self) -> str:
+        """Stops following and starts accepting writes (and followers, when replication.port is set)."""
+        with self._lock:
+            if self.follower is None:
+                raise ReplicationError("Node už je primární.")
+            follower = self.follower
+            follower.close()
+            self.follower = None
+            self._start_primary(first_seq=follower.applied_seq)
+            self.bank.read_only = False
+            self.logger.warning("replication_promoted seq=%s", follower.applied_seq)
+            return self.status()
@@ -1,125 +1,411 @@
+import asyncio
+import signal
 import socket
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from .logging_setup import setup_logging
+from .logging_setup import setup_logging, stop_logging, access_log_sampled, dropped_log_records
 from .protocol import parse_command, validate_and_normalize, ProtocolError
 from .bank import Bank, BankError
-from .proxy import forward_command, ProxyError
+from .storage import build_storage
+from .proxy import (forward_commands, PeerPool, PeerRegistry, ReadCoalescer, ProxyError, build_peer_registry,
+                    build_read_coalescer)
+from .metrics import METRICS, start_metrics_http
+from .profiler import PROFILER
+from .commands import (is_proxied, PROXIED_READ_CODES, execute, execute_local, format_request, parse_reply, group_batch,
+                       execute_batch_local, format_batch_reply)
+from .replication import Replication
+from .admission import Admission, HandlerPool, shed
+from .survey import SURVEY_CODES, run_survey
+from .binproto import BINARY_VERSION, FRAME_HEADER, decode_request, encode_reply
 
+MAX_LINE_BYTES = 65536
+LINE_TOO_LONG_REPLY = "ER Příkaz je příliš dlouhý.\n".encode("utf-8")
+BINARY_HANDSHAKE_REPLY = f"BP {BINARY_VERSION}"
 
-def _recv_line(conn: socket.socket) -> str | None:
-    data = b""
-    while not data.endswith(b"\n"):
-        chunk = conn.recv(4096)
-        if not chunk:
-            return None
-        data += chunk
-    return data.decode("utf-8", errors="replace").strip()
+# Forwards the per-peer groups of BT batches concurrently.
+_batch_forwarder = ThreadPoolExecutor(max_workers=16, thread_name_prefix="batch-forward")
 
 
-def _handle_client(conn: socket.socket, addr, cfg, bank: Bank, logger):
+class LineTooLongError(Exception):
+    pass
+
+
+class LineReader:
+    """
+    Per-connection buffered reader. One recv can carry several pipelined commands,
+    read_lines() returns all complete lines and keeps the unfinished rest for the next call.
+    After the BP handshake the same buffer is read as binary frames by read_frames().
+    """
+
+    def __init__(self, conn: socket.socket, max_line_bytes: int = MAX_LINE_BYTES):
+        self.conn = conn
+        self.max_line_bytes = max_line_bytes
+        self._buf = bytearray()
+        self._chunk = memoryview(bytearray(4096))
+
+    def _fill(self) -> bool:
+        n = self.conn.recv_into(self._chunk)
+        if not n:
+            return False
+        self._buf += self._chunk[:n]
+        return True
+
+    def read_lines(self, stop=None) -> list[str] | None:
+        """
+        Blocks until at least one line is complete. Returns None when the client closed the connection.
+        Lines after the first one matching stop(line) stay buffered.
+        """
+        while True:
+            lines = []
+            pos = 0
+            while True:
+                nl = self._buf.find(b"\n", pos)
+                if nl < 0:
+                    break
+                line = self._buf[pos:nl].decode("utf-8", errors="replace").strip()
+                pos = nl + 1
+                lines.append(line)
+                if stop is not None and stop(line):
+                    break
+            if lines:
+                del self._buf[:pos]
+                return lines
+            if len(self._buf) > self.max_line_bytes:
+                raise LineTooLongError()
+            if not self._fill():
+                return None
+
+    def read_frames(self) -> list[bytes] | None:
+        """Blocks until at least one binary frame is complete. Returns None when the client closed the connection."""
+        while True:
+            frames = []
+            pos = 0
+            while len(self._buf) - pos >= FRAME_HEADER.size:
+                (size,) = FRAME_HEADER.unpack_from(self._buf, pos)
+                if len(self._buf) - pos - FRAME_HEADER.size < size:
+                    break
+                start = pos + FRAME_HEADER.size
+                frames.append(bytes(self._buf[start:start + size]))
+                pos = start + size
+            if frames:
+                del self._buf[:pos]
+                return frames
+            if not self._fill():
+                return None
+
+
+def _is_handshake(line: str) -> bool:
+    return line.upper() == "BP"
+
+
+def observe_command(code: str, started: float, error: bool) -> None:
+    labels = {"code": code}
+    METRICS.inc("commands_total", labels)
+    if error:
+        METRICS.inc("command_errors_total", labels)
+    METRICS.observe("command_latency_ms", (time.perf_counter() - started) * 1000, labels)
+
+
+def observe_proxy(target: str, started: float, error: bool) -> None:
+    labels = {"peer": target}
+    if error:
+        METRICS.inc("proxy_errors_total", labels)
+    METRICS.observe("proxy_latency_ms", (time.perf_counter() - started) * 1000, labels)
+    PROFILER.phase("proxy", started)
+
+
+def _forward(target: str, line: str, cfg, pool: PeerPool | None, peers: PeerRegistry) -> str:
+    return _forward_many(target, [line], cfg, pool, peers)[0]
+
+
+def _proxy(cmd: dict, line: str, cfg, pool: PeerPool | None, peers: PeerRegistry,
+           reads: ReadCoalescer | None) -> str:
+    target = cmd["bank_ip"]
+    if reads is not None and cmd["code"] in PROXIED_READ_CODES:
+        key = format_request(cmd)
+        return reads.call(key, _forward, target, key, cfg, pool, peers)
+    return _forward(target, line, cfg, pool, peers)
+
+
+def _forward_many(target: str, lines: list[str], cfg, pool: PeerPool | None, peers: PeerRegistry) -> list[str]:
+    proxy_started = time.perf_counter()
+    try:
+        if pool is not None:
+            resp = peers.call(target, pool.forward_many, target, lines)
+        else:
+            resp = peers.call(target, forward_commands, target, int(cfg["bank"]["port"]), lines,
+                              float(cfg["timeouts"]["proxy_timeout_sec"]),
+                              float(cfg["timeouts"]["proxy_connect_timeout_sec"]))
+    except ProxyError:
+        observe_proxy(target, proxy_started, True)
+        raise
+    observe_proxy(target, proxy_started, False)
+    return resp
+
+
+def _run_batch(cmd: dict, cfg, bank: Bank, pool: PeerPool | None, peers: PeerRegistry) -> str:
+    """
+    BT: local operations are applied all or nothing, operations for other banks are sent
+    to each peer as one pipelined group, the groups run concurrently with the local part.
+    """
+    ops = cmd["ops"]
+    local, remote = group_batch(cmd, cfg["bank"]["code"])
+    futures = {
+        target: _batch_forwarder.submit(_forward_many, target, [format_request(ops[i]) for i in idx], cfg, pool, peers)
+        for target, idx in remote.items()
+    }
+
+    results: list[str] = [""] * len(ops)
+    if local:
+        for i, resp in zip(local, execute_batch_local([ops[i] for i in local], bank)):
+            results[i] = resp
+    for target, fut in futures.items():
+        try:
+            replies = fut.result()
+        except ProxyError as e:
+            replies = [f"ER Proxy chyba: {e}"] * len(remote[target])
+        for i, resp in zip(remote[target], replies):
+            results[i] = resp
+    return format_batch_reply(results)
+
+
+def _process_line(line: str, addr, cfg, bank: Bank, logger, pool: PeerPool | None, peers: PeerRegistry,
+                  reads: ReadCoalescer | None) -> str:
+    bank_ip = cfg["bank"]["code"]
+
+    if not line:
+        return "ER Prazdny prikaz."
+
+    started = time.perf_counter()
+    code = "invalid"
+    target = "-"
+    try:
+        cmd = validate_and_normalize(*parse_command(line))
+        code = cmd["code"]
+        PROFILER.phase("parse", started)
+
+        if code == "BP":
+            resp = BINARY_HANDSHAKE_REPLY
+        elif code == "BT":
+            resp = _run_batch(cmd, cfg, bank, pool, peers)
+        elif code in SURVEY_CODES:
+            resp = run_survey(code, cfg, bank, peers)
+        elif is_proxied(cmd, bank_ip):
+            target = cmd["bank_ip"]
+            resp = _proxy(cmd, line, cfg, pool, peers, reads)
+        else:
+            resp = execute_local(cmd, bank, bank_ip)
+
+        observe_command(code, started, resp.startswith("ER "))
+        if access_log_sampled(cfg):
+            logger.info('access client=%s:%s line="%s" resp="%s" proxy=%s ms=%.2f',
+                        addr[0], addr[1], line, resp, target, (time.perf_counter() - started) * 1000)
+        return resp
+
+    except (ProtocolError, BankError) as e:
+        observe_command(code, started, True)
+        msg = str(e)
+        logger.warning('client=%s:%s line="%s" error="%s"', addr[0], addr[1], line, msg)
+        return "ER " + msg
+    except ProxyError as e:
+        observe_command(code, started, True)
+        msg = f"Proxy chyba: {e}"
+        logger.warning('client=%s:%s line="%s" proxy=%s error="%s"', addr[0], addr[1], line, target, msg)
+        return "ER " + msg
+    except Exception as e:
+        observe_command(code, started, True)
+        msg = f"Chyba v aplikaci, prosím zkuste to později. ({e})"
+        logger.exception(msg)
+        return "ER " + msg
+
+
+def _process_frame(body: bytes, addr, cfg, bank: Bank, logger, pool: PeerPool | None,
+                   peers: PeerRegistry, reads: ReadCoalescer | None) -> bytes:
+    """Binary counterpart of _process_line, returns an encoded reply frame."""
+    bank_ip = cfg["bank"]["code"]
+
+    started = time.perf_counter()
+    code = "invalid"
+    target = "-"
+    try:
+        cmd = decode_request(body)
+        code = cmd["code"]
+        PROFILER.phase("parse", started)
+
+        if is_proxied(cmd, bank_ip):
+            # Peers speak the text protocol.
+            target = cmd["bank_ip"]
+            reply = parse_reply(_proxy(cmd, format_request(cmd), cfg, pool, peers, reads))
+        else:
+            reply = execute(cmd, bank, bank_ip)
+
+        observe_command(code, started, reply[0] == "ER")
+        if access_log_sampled(cfg):
+            logger.info('access client=%s:%s frame="%s" resp=%s proxy=%s ms=%.2f',
+                        addr[0], addr[1], format_request(cmd), reply[0], target, (time.perf_counter() - started) * 1000)
+        return encode_reply(*reply)
+
+    except (ProtocolError, BankError) as e:
+        observe_command(code, started, True)
+        msg = str(e)
+        logger.warning('client=%s:%s frame error="%s"', addr[0], addr[1], msg)
+        return encode_reply("ER", msg)
+    except ProxyError as e:
+        observe_command(code, started, True)
+        msg = f"Proxy chyba: {e}"
+        logger.warning('client=%s:%s frame proxy=%s error="%s"', addr[0], addr[1], target, msg)
+        return encode_reply("ER", msg)
+    except Exception as e:
+        observe_command(code, started, True)
+        msg = f"Chyba v aplikaci, prosím zkuste to později. ({e})"
+        logger.exception(msg)
+        return encode_reply("ER", msg)
+
+
+def _handle_client(conn: socket.socket, addr, cfg, bank: Bank, logger, pool: PeerPool | None,
+                   peers: PeerRegistry, reads: ReadCoalescer | None):
     idle_timeout = float(cfg["timeouts"]["client_idle_timeout_sec"])
-    proxy_timeout = float(cfg["timeouts"]["proxy_timeout_sec"])
-    bank_ip = cfg["bank"]["ip"]
-    bank_port = int(cfg["bank"]["port"])
 
     conn.settimeout(idle_timeout)
-    logger.info(f"client_connected client={addr[0]}:{addr[1]}")
+    logger.info("client_connected client=%s:%s", addr[0], addr[1])
+    reader = LineReader(conn)
+    binary = False
+    METRICS.add_gauge("active_connections", 1)
 
     try:
         while True:
             try:
-                line = _recv_line(conn)
-                if line is None:
-                    logger.info(f"client_closed client={addr[0]}:{addr[1]}")
+                if binary:
+                    frames = reader.read_frames()
+                    lines = None
+                else:
+                    # Stop at BP, whatever follows it is already binary.
+                    lines = reader.read_lines(stop=_is_handshake)
+                    frames = None
+                if frames is None and lines is None:
+                    logger.info("client_closed client=%s:%s", addr[0], addr[1])
                     return
             except socket.timeout:
-                logger.info(f"client_timeout client={addr[0]}:{addr[1]}")
+                logger.info("client_timeout client=%s:%s", addr[0], addr[1])
+                return
+            except LineTooLongError:
+                logger.warning("client_line_too_long client=%s:%s", addr[0], addr[1])
+                conn.sendall(LINE_TOO_LONG_REPLY)
                 return
 
-            if not line:
-                conn.sendall(b"ER Prazdny prikaz.\n")
+            if binary:
+                data = b"".join(_process_frame(body, addr, cfg, bank, logger, pool, peers, reads) for body in frames)
+                send_started = time.perf_counter()
+                conn.sendall(data)
+                PROFILER.phase("send", send_started)
                 continue
 
-            logger.info(f'client={addr[0]}:{addr[1]} line="{line}"')
-
-            try:
-                code, args = parse_command(line)
-                cmd = validate_and_normalize(code, args)
-
-                if cmd["code"] in ("AD", "AW", "AB") and cmd.get("bank_ip") != bank_ip:
-                    target_ip = cmd["bank_ip"]
-                    resp = forward_command(target_ip, bank_port, line, proxy_timeout)
-                    logger.info(f'proxy target={target_ip}:{bank_port} resp="{resp}"')
-                    conn.sendall((resp + "\n").encode("utf-8"))
-                    continue
-
-                c = cmd["code"]
-                if c == "BC":
-                    resp = f"BC {bank_ip}"
-                elif c == "AC":
-                    acct = bank.create_account()
-                    resp = f"AC {acct}/{bank_ip}"
-                elif c == "AD":
-                    bank.deposit(cmd["account"], cmd["amount"])
-                    resp = "AD"
-                elif c == "AW":
-                    bank.withdraw(cmd["account"], cmd["amount"])
-                    resp = "AW"
-                elif c == "AB":
-                    bal = bank.balance(cmd["account"])
-                    resp = f"AB {bal}"
-                elif c == "AR":
-                    bank.remove(cmd["account"])
-                    resp = "AR"
-                elif c == "BA":
-                    resp = f"BA {bank.total_amount()}"
-                elif c == "BN":
-                    resp = f"BN {bank.number_of_clients()}"
-                else:
-                    raise ProtocolError("Nepovolený příkaz.")
-
-                conn.sendall((resp + "\n").encode("utf-8"))
-                logger.info(f'client={addr[0]}:{addr[1]} resp="{resp}"')
-
-            except (ProtocolError, BankError) as e:
-                msg = str(e)
-                logger.warning(f'client={addr[0]}:{addr[1]} error="{msg}"')
-                conn.sendall(("ER " + msg + "\n").encode("utf-8"))
-            except ProxyError as e:
-                msg = f"Proxy chyba: {e}"
-                logger.warning(f'client={addr[0]}:{addr[1]} error="{msg}"')
-                conn.sendall(("ER " + msg + "\n").encode("utf-8"))
-            except Exception as e:
-                msg = f"Chyba v aplikaci, prosím zkuste to později. ({e})"
-                logger.exception(msg)
-                conn.sendall(("ER " + msg + "\n").encode("utf-8"))
+            # Pipelined commands are answered in order with a single send.
+            out = [_process_line(line, addr, cfg, bank, logger, pool, peers, reads) for line in lines]
+            send_started = time.perf_counter()
+            conn.sendall(("\n".join(out) + "\n").encode("utf-8"))
+            PROFILER.phase("send", send_started)
+            if out[-1] == BINARY_HANDSHAKE_REPLY:
+                binary = True
+                logger.info("client_binary client=%s:%s", addr[0], addr[1])
 
+    except OSError:
+        logger.info("client_closed client=%s:%s", addr[0], addr[1])
     finally:
+        METRICS.add_gauge("active_connections", -1)
         try:
             conn.close()
         except Exception:
             pass
 
 
-def run_server(cfg: dict):
-    logger = setup_logging(cfg)
-
+def serve_clients(cfg: dict, bank, logger, reuse_port: bool = False):
+    """Accept loop of the configured engine. bank is a Bank or anything with the same methods."""
     bank_ip = cfg["bank"]["ip"]
     bank_port = int(cfg["bank"]["port"])
-    data_file = cfg["storage"]["data_file"]
 
-    bank = Bank(bank_ip=bank_ip, data_file=data_file, logger=logger)
-    bank.load_from_disk()
+    if cfg["server"]["engine"] == "asyncio":
+        from .aio_server import run_async_server
+        asyncio.run(run_async_server(cfg, bank, logger, reuse_port=reuse_port))
+        return
 
-    logger.info(f"Starting bank node on {bank_ip}:{bank_port}, data_file={data_file}")
+    pool = None
+    if cfg["proxy"]["pool_enabled"]:
+        pool = PeerPool(
+            port=bank_port,
+            timeout_sec=float(cfg["timeouts"]["proxy_timeout_sec"]),
+            max_per_peer=int(cfg["proxy"]["max_connections_per_peer"]),
+            idle_ttl_sec=float(cfg["proxy"]["pool_idle_ttl_sec"]),
+            connect_timeout_sec=float(cfg["timeouts"]["proxy_connect_timeout_sec"]),
+        )
+    peers = build_peer_registry(cfg)
+    reads = build_read_coalescer(cfg)
+    METRICS.gauge_fn("proxy_open_circuits", peers.open_circuits)
+    PROFILER.configure(cfg)
 
     srv = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        srv.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     srv.bind((bank_ip, bank_port))
-    srv.listen(50)
+    srv.listen(int(cfg["server"]["backlog"]))
+
+    server = cfg["server"]
+    admission = Admission(int(server["max_connections"]), int(server["max_connections_per_ip"]))
+    handlers = HandlerPool(
+        lambda conn, addr: _handle_client(conn, addr, cfg, bank, logger, pool, peers, reads),
+        max_threads=int(server["handler_threads"]),
+        queue_size=int(server["handler_queue"]),
+        queue_timeout_sec=float(server["handler_queue_timeout_sec"]),
+        logger=logger,
+    )
+    release = lambda addr: admission.release(addr[0])
 
     while True:
         conn, addr = srv.accept()
-        t = threading.Thread(target=_handle_client, args=(conn, addr, cfg, bank, logger), daemon=True)
-        t.start()
\ No newline at end of file
+        reason = admission.admit(addr[0])
+        if reason is None and not handlers.submit(conn, addr, release):
+            admission.release(addr[0])
+            reason = "queue_full"
+        if reason is not None:
+            shed(conn, addr, reason, logger)
+
+
+def run_server(cfg: dict):
+    logger = setup_logging(cfg)
+
+    bank_ip = cfg["bank"]["ip"]
+    bank_port = int(cfg["bank"]["port"])
+    data_file = cfg["storage"]["data_file"]
+
+    bank = Bank(bank_ip=cfg["bank"]["code"], storage=build_storage(cfg), logger=logger)
+    bank.load_from_disk()
+    bank.start_snapshots()
+    bank.replication = Replication(cfg, bank, logger)
+
+    METRICS.gauge_fn("accounts", bank.number_of_clients)
+    METRICS.gauge_fn("dropped_log_records", dropped_log_records)
+    METRICS.gauge_fn("recovery_ms", lambda: bank.recovery_ms)
+    if cfg["metrics"]["http_port"]:
+        start_metrics_http(bank_ip, int(cfg["metrics"]["http_port"]), logger)
+
+    PROFILER.configure(cfg)
+    if hasattr(signal, "SIGUSR2"):
+        signal.signal(signal.SIGUSR2, lambda signum, frame: logger.warning("profiler %s", PROFILER.toggle()))
+
+    engine = cfg["server"]["engine"]
+    workers = int(cfg["server"]["workers"])
+    logger.info("Starting bank node on %s:%s, data_file=%s, storage=%s, engine=%s, workers=%s, replication=%s",
+                bank_ip, bank_port, data_file, cfg["storage"]["mode"], engine, workers, bank.replication_status())
+
+    try:
+        if workers > 0:
+            from .multiproc import run_multiprocess
+            run_multiprocess(cfg, bank, logger)
+        else:
+            serve_clients(cfg, bank, logger)
+    finally:
+        bank.close()
+        stop_logging()
@@ -0,0 +1,376 @@
+import os
+import re
+import threading
+
+from p2p_bank_node.libs.pvl_persist import (
+    load_json,
+    save_json_atomic,
+    OpLog,
+    read_oplog,
+    save_int_map_atomic,
+    load_int_map,
+    MappedIntTable,
+    PersistenceError,
+)
+
+from .allocator import ACCOUNT_MIN, ACCOUNT_MAX
+
+
+def _accounts_from_json(raw: dict) -> dict[int, int]:
+    acc = {}
+    for k, v in (raw.get("accounts") or {}).items():
+        acc[int(k)] = int(v)
+    return acc
+
+
+class JsonStorage:
+    """Original mode: the whole state is rewritten to one JSON file after every change."""
+
+    snapshot_interval_sec = None
+
+    def __init__(self, data_file: str):
+        self.data_file = data_file
+        self.records_replayed = 0
+        self._lock = threading.Lock()
+
+    def load(self) -> dict[int, int]:
+        return _accounts_from_json(load_json(self.data_file, default={"accounts": {}}))
+
+    def write(self, accounts: dict[int, int], acct: int, balance: int | None):
+        # Writers on other lock stripes may change the dict meanwhile: copy and write under one lock,
+        # so the file written last always contains every finished change.
+        with self._lock:
+            save_json_atomic(self.data_file, {"accounts": dict(accounts)})
+        return None
+
+    def write_batch(self, accounts: dict[int, int], changes: dict[int, int | None]):
+        # The file holds the whole state anyway, one rewrite covers every change of the batch.
+        with self._lock:
+            save_json_atomic(self.data_file, {"accounts": dict(accounts)})
+        return None
+
+    def sync(self, token) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+class WalStorage:
+    """
+    JSON checkpoint + append-only operation log.
+    A change costs one small log record, concurrent changes share one fsync (group commit).
+    Records hold the new absolute balance, so replaying a record twice is harmless.
+
+    Once the log holds checkpoint_ops records or checkpoint_bytes, the bank's snapshot loop
+    checkpoints it: under the bank lock the log is renamed to <wal_file>.old and a fresh
+    wal_file is started, then the state is written to data_file and the .old log deleted.
+    Recovery replays data_file + .old (if a checkpoint was interrupted) + wal_file.
+    """
+
+    # How often the snapshot loop asks whether a checkpoint is due (cheap when it is not).
+    snapshot_interval_sec = 1.0
+
+    def __init__(self, data_file: str, wal_file: str, durability: str, flush_interval_sec: float,
+                 checkpoint_ops: int, checkpoint_bytes: int):
+        self.data_file = data_file
+        self.wal_file = wal_file
+        self.old_wal_file = wal_file + ".old"
+        self.durability = durability
+        self.flush_interval_sec = flush_interval_sec
+        self.checkpoint_ops = checkpoint_ops
+        self.checkpoint_bytes = checkpoint_bytes
+        self.records_replayed = 0
+        self._log: OpLog | None = None
+
+    def load(self) -> dict[int, int]:
+        accounts = _accounts_from_json(load_json(self.data_file, default={"accounts": {}}))
+        replayed = 0
+        for path in (self.old_wal_file, self.wal_file):
+            records = read_oplog(path)
+            for rec in records:
+                _apply_record(accounts, rec)
+            replayed += len(records)
+        self.records_replayed = replayed
+
+        # Checkpoint the replayed state so the log starts empty.
+        save_json_atomic(self.data_file, {"accounts": accounts})
+        self._remove_old_log()
+        self._log = OpLog(self.wal_file, durability=self.durability, flush_interval_sec=self.flush_interval_sec)
+        self._log.truncate()
+        return accounts
+
+    def _remove_old_log(self) -> None:
+        try:
+            os.remove(self.old_wal_file)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            raise PersistenceError(str(e))
+
+    def write(self, accounts: dict[int, int], acct: int, balance: int | None):
+        return self._log.append(change_record(acct, balance))
+
+    def write_batch(self, accounts: dict[int, int], changes: dict[int, int | None]):
+        return self._log.append(batch_record(changes))
+
+    def sync(self, token) -> None:
+        self._log.wait_durable(token)
+
+    def snapshot_due(self) -> bool:
+        return self._log.records >= self.checkpoint_ops or self._log.bytes >= self.checkpoint_bytes
+
+    def begin_snapshot(self, accounts: dict[int, int]):
+        """Called under the bank lock: moves the current log aside and starts a new one."""
+        if not self.snapshot_due():
+            return None
+        if os.path.exists(self.old_wal_file):
+            # The previous checkpoint failed after the rename: .old + wal_file are the full history
+            # since data_file, so a checkpoint of the current state makes .old redundant.
+            return self.old_wal_file, dict(accounts)
+        try:
+            os.replace(self.wal_file, self.old_wal_file)
+        except OSError as e:
+            raise PersistenceError(str(e))
+        # Flushes what is queued into the renamed file and continues in a new wal_file.
+        self._log.rotate(self.wal_file)
+        return self.old_wal_file, dict(accounts)
+
+    def write_snapshot(self, job) -> None:
+        _, accounts = job
+        save_json_atomic(self.data_file, {"accounts": accounts})
+        self._remove_old_log()
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+
+
+_SEGMENT_RE = re.compile(r"^(oplog|snapshot)\.(\d+)\.(log|bin)$")
+
+
+class SnapshotStorage:
+    """
+    Binary snapshots + segmented operation log.
+
+    snapshot.<n>.bin holds the state at the start of log segment oplog.<n>.log.
+    A snapshot rotates the log to a new segment under the bank lock (cheap),
+    the snapshot file itself is written outside the lock. Recovery loads the newest
+    valid snapshot and replays only the segments from its number on.
+    The JSON data_file is only read when no snapshot exists yet (migration from json/wal mode).
+    """
+
+    def __init__(self, data_file: str, snapshot_dir: str, durability: str, flush_interval_sec: float,
+                 snapshot_interval_sec: float):
+        self.data_file = data_file
+        self.snapshot_dir = snapshot_dir
+        self.durability = durability
+        self.flush_interval_sec = flush_interval_sec
+        self.snapshot_interval_sec = snapshot_interval_sec
+        self.records_replayed = 0
+        self.snapshot_loaded: str | None = None
+        self._segment = 0
+        self._dirty = False
+        self._log: OpLog | None = None
+
+    def _path(self, kind: str, n: int) -> str:
+        ext = "log" if kind == "oplog" else "bin"
+        return os.path.join(self.snapshot_dir, f"{kind}.{n:08d}.{ext}")
+
+    def _list(self, kind: str) -> list[int]:
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        ids = []
+        for name in os.listdir(self.snapshot_dir):
+            m = _SEGMENT_RE.match(name)
+            if m and m.group(1) == kind:
+                ids.append(int(m.group(2)))
+        return sorted(ids)
+
+    def load(self) -> dict[int, int]:
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        snapshots = self._list("snapshot")
+        segments = self._list("oplog")
+
+        accounts = None
+        base = 0
+        for n in reversed(snapshots):
+            try:
+                accounts = load_int_map(self._path("snapshot", n))
+                base = n
+                self.snapshot_loaded = os.path.basename(self._path("snapshot", n))
+                break
+            except PersistenceError:
+                continue
+        if accounts is None:
+            accounts = _accounts_from_json(load_json(self.data_file, default={"accounts": {}}))
+
+        replayed = 0
+        for n in segments:
+            if n < base:
+                continue
+            for rec in read_oplog(self._path("oplog", n)):
+                _apply_record(accounts, rec)
+                replayed += 1
+        self.records_replayed = replayed
+        self._dirty = replayed > 0 or not snapshots
+
+        self._segment = max(snapshots + segments + [0]) + 1
+        self._log = OpLog(self._path("oplog", self._segment), durability=self.durability,
+                          flush_interval_sec=self.flush_interval_sec)
+        return accounts
+
+    def write(self, accounts: dict[int, int], acct: int, balance: int | None):
+        self._dirty = True
+        return self._log.append(change_record(acct, balance))
+
+    def write_batch(self, accounts: dict[int, int], changes: dict[int, int | None]):
+        self._dirty = True
+        return self._log.append(batch_record(changes))
+
+    def sync(self, token) -> None:
+        self._log.wait_durable(token)
+
+    def snapshot_due(self) -> bool:
+        return self._dirty
+
+    def begin_snapshot(self, accounts: dict[int, int]):
+        """Called under the bank lock. Returns None when nothing changed since the last snapshot."""
+        if not self._dirty:
+            return None
+        self._segment += 1
+        self._log.rotate(self._path("oplog", self._segment))
+        self._dirty = False
+        return self._segment, dict(accounts)
+
+    def write_snapshot(self, job) -> None:
+        n, accounts = job
+        try:
+            save_int_map_atomic(self._path("snapshot", n), accounts)
+        except PersistenceError:
+            self._dirty = True
+            raise
+        # Everything before snapshot n is now redundant.
+        for kind in ("snapshot", "oplog"):
+            for old in self._list(kind):
+                if old < n:
+                    try:
+                        os.remove(self._path(kind, old))
+                    except OSError:
+                        pass
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+
+
+class MmapStorage:
+    """
+    Fixed-layout memory-mapped table (one int64 per account number 10000-99999 + existence bitmap).
+    load() returns the table itself as Bank.accounts, so a change is an in-place store and there is
+    nothing to write or replay; startup is an mmap. The JSON data_file is only read when the table
+    file does not exist yet (migration from json mode).
+
+    durability "batch" msyncs the pages touched by a change before the reply,
+    "interval" msyncs the whole table every flush_interval_sec. A process crash loses nothing
+    either way, the pages live in the OS page cache.
+    """
+
+    snapshot_interval_sec = None
+
+    def __init__(self, data_file: str, mmap_file: str, durability: str, flush_interval_sec: float):
+        self.data_file = data_file
+        self.mmap_file = mmap_file
+        self.durability = durability
+        self.flush_interval_sec = flush_interval_sec
+        self.records_replayed = 0
+        self._table: MappedIntTable | None = None
+        self._stop = threading.Event()
+        self._flusher: threading.Thread | None = None
+
+    def load(self) -> MappedIntTable:
+        # The JSON seed is read only when the table file is created, and written into it before it appears.
+        self._table = MappedIntTable(self.mmap_file, ACCOUNT_MIN, ACCOUNT_MAX, seed=self._json_accounts)
+        if self.durability == "interval":
+            self._flusher = threading.Thread(target=self._flush_loop, name="mmap-flush", daemon=True)
+            self._flusher.start()
+        return self._table
+
+    def _json_accounts(self) -> dict[int, int]:
+        return _accounts_from_json(load_json(self.data_file, default={"accounts": {}}))
+
+    def _flush_loop(self) -> None:
+        while not self._stop.wait(self.flush_interval_sec):
+            try:
+                self._table.flush()
+            except PersistenceError:
+                pass
+
+    def write(self, accounts, acct: int, balance: int | None):
+        # Bank already stored the change into the mapping, the token says which pages to msync.
+        return (acct,)
+
+    def write_batch(self, accounts, changes: dict[int, int | None]):
+        return tuple(changes)
+
+    def sync(self, token) -> None:
+        if self.durability == "batch":
+            self._table.flush_keys(token)
+
+    def close(self) -> None:
+        self._stop.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        if self._table is not None:
+            self._table.close()
+
+
+def change_record(acct: int, balance: int | None) -> dict:
+    """Log (and replication feed) record of one change, balance None = account removed."""
+    if balance is None:
+        return {"op": "del", "acct": acct}
+    return {"op": "set", "acct": acct, "bal": balance}
+
+
+def batch_record(changes: dict[int, int | None]) -> dict:
+    # One log line for the whole batch: a torn last line drops the batch as a whole.
+    return {"op": "batch", "ops": [change_record(acct, bal) for acct, bal in changes.items()]}
+
+
+def _apply_record(accounts: dict[int, int], rec: dict) -> None:
+    if rec["op"] == "set":
+        accounts[int(rec["acct"])] = int(rec["bal"])
+    elif rec["op"] == "del":
+        accounts.pop(int(rec["acct"]), None)
+    elif rec["op"] == "batch":
+        for sub in rec["ops"]:
+            _apply_record(accounts, sub)
+
+
+def build_storage(cfg: dict):
+    storage = cfg["storage"]
+    if storage["mode"] == "wal":
+        return WalStorage(
+            data_file=storage["data_file"],
+            wal_file=storage["wal_file"],
+            durability=storage["wal_durability"],
+            flush_interval_sec=float(storage["wal_flush_interval_sec"]),
+            checkpoint_ops=int(storage["wal_checkpoint_ops"]),
+            checkpoint_bytes=int(float(storage["wal_checkpoint_mb"]) * 1024 * 1024),
+        )
+    if storage["mode"] == "snapshot":
+        return SnapshotStorage(
+            data_file=storage["data_file"],
+            snapshot_dir=storage["snapshot_dir"],
+            durability=storage["wal_durability"],
+            flush_interval_sec=float(storage["wal_flush_interval_sec"]),
+            snapshot_interval_sec=float(storage["snapshot_interval_sec"]),
+        )
+    if storage["mode"] == "mmap":
+        return MmapStorage(
+            data_file=storage["data_file"],
+            mmap_file=storage["mmap_file"],
+            durability=storage["wal_durability"],
+            flush_interval_sec=float(storage["wal_flush_interval_sec"]),
+        )
+    return JsonStorage(storage["data_file"])
@@ -0,0 +1,134 @@
+import asyncio
+import ipaddress
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from .proxy import forward_commands, forward_commands_async, PeerRegistry, ProxyError
+
+# Network-wide variants of the local aggregates: NA sums BA, NN sums BN over this bank and its peers.
+SURVEY_CODES = {"NA": "BA", "NN": "BN"}
+MAX_SCAN_HOSTS = 1024
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _executor(cfg: dict) -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=int(cfg["network"]["max_parallel"]), thread_name_prefix="survey")
+        return _pool
+
+
+def survey_targets(cfg: dict) -> list[str]:
+    """network.peers plus every host of network.scan, without this node itself."""
+    net = cfg["network"]
+    targets = [str(ip) for ip in net["peers"]]
+    if net["scan"]:
+        targets += [str(host) for host in ipaddress.ip_network(net["scan"], strict=False).hosts()]
+    own = {cfg["bank"]["ip"], cfg["bank"]["code"]}
+    return [ip for ip in dict.fromkeys(targets) if ip not in own]
+
+
+def _parse_value(local_code: str, resp: str) -> int | None:
+    code, _, rest = resp.partition(" ")
+    return int(rest) if code == local_code and rest.isdigit() else None
+
+
+def _outcome(local_code: str, resp: str | None, error: Exception | None, started: float, deadline: float):
+    now = time.monotonic()
+    ms = (now - started) * 1000
+    if error is not None:
+        return None, "timeout" if now >= deadline else "error", ms
+    value = _parse_value(local_code, resp)
+    return value, "ok" if value is not None else "error", ms
+
+
+def _query(target: str, local_code: str, cfg: dict, peers: PeerRegistry, deadline: float):
+    started = time.monotonic()
+    remaining = deadline - started
+    if remaining <= 0:
+        return None, "timeout", 0.0
+    connect_timeout = min(float(cfg["timeouts"]["proxy_connect_timeout_sec"]), remaining)
+    try:
+        resp = peers.call(target, forward_commands, target, int(cfg["bank"]["port"]), [local_code],
+                          remaining, connect_timeout)[0]
+    except ProxyError as e:
+        return _outcome(local_code, None, e, started, deadline)
+    return _outcome(local_code, resp, None, started, deadline)
+
+
+async def _query_async(target: str, local_code: str, cfg: dict, peers: PeerRegistry, deadline: float):
+    started = time.monotonic()
+    remaining = deadline - started
+    if remaining <= 0:
+        return None, "timeout", 0.0
+    connect_timeout = min(float(cfg["timeouts"]["proxy_connect_timeout_sec"]), remaining)
+    try:
+        resp = (await peers.call_async(target, forward_commands_async, target, int(cfg["bank"]["port"]),
+                                       [local_code], remaining, connect_timeout))[0]
+    except ProxyError as e:
+        return _outcome(local_code, None, e, started, deadline)
+    return _outcome(local_code, resp, None, started, deadline)
+
+
+def format_survey(code: str, results: list[tuple[str, int | None, str, float]]) -> str:
+    """
+    NA <sum> ok=<answered>/<asked> <ip>=<value>(<ms>ms) ...
+    The sum covers the banks that answered before the deadline; the others are listed
+    as timeout/error, so a partial result is visible as such.
+    """
+    answered = [value for _, value, _, _ in results if value is not None]
+    parts = [f"{code} {sum(answered)}", f"ok={len(answered)}/{len(results)}"]
+    for ip, value, status, ms in results:
+        parts.append(f"{ip}={value if value is not None else status}({ms:.1f}ms)")
+    return " ".join(parts)
+
+
+def _local_value(local_code: str, bank) -> int:
+    return bank.total_amount() if local_code == "BA" else bank.number_of_clients()
+
+
+def run_survey(code: str, cfg: dict, bank, peers: PeerRegistry) -> str:
+    """Asks every peer concurrently, waits until network.deadline_sec at most."""
+    local_code = SURVEY_CODES[code]
+    deadline = time.monotonic() + float(cfg["network"]["deadline_sec"])
+    targets = survey_targets(cfg)
+
+    pool = _executor(cfg)
+    futures = [pool.submit(_query, ip, local_code, cfg, peers, deadline) for ip in targets]
+    results = [(cfg["bank"]["code"], _local_value(local_code, bank), "ok", 0.0)]
+    done, _ = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+    timeout_ms = float(cfg["network"]["deadline_sec"]) * 1000
+    for ip, fut in zip(targets, futures):
+        if fut in done:
+            results.append((ip, *fut.result()))
+        else:
+            fut.cancel()
+            results.append((ip, None, "timeout", timeout_ms))
+    return format_survey(code, results)
+
+
+async def run_survey_async(code: str, cfg: dict, bank, peers: PeerRegistry) -> str:
+    local_code = SURVEY_CODES[code]
+    deadline = time.monotonic() + float(cfg["network"]["deadline_sec"])
+    targets = survey_targets(cfg)
+
+    tasks = [asyncio.create_task(_query_async(ip, local_code, cfg, peers, deadline)) for ip in targets]
+    # bank may be a RemoteBank (multiprocess mode), keep the call off the event loop.
+    local = await asyncio.get_running_loop().run_in_executor(None, _local_value, local_code, bank)
+    results = [(cfg["bank"]["code"], local, "ok", 0.0)]
+    if tasks:
+        await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()))
+
+    timeout_ms = float(cfg["network"]["deadline_sec"]) * 1000
+    for ip, task in zip(targets, tasks):
+        if task.done():
+            results.append((ip, *task.result()))
+        else:
+            task.cancel()
+            results.append((ip, None, "timeout", timeout_ms))
+    return format_survey(code, results)
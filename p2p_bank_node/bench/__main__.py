@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+
+import yaml
+
+from .runner import run_benchmark, parse_mix, BenchError
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load test for the P2P bank node protocol.")
+    parser.add_argument("--clients", type=int, default=16, help="Concurrent client connections.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Measured run time in seconds.")
+    parser.add_argument("--mix", default="AD=30,AW=20,AB=40,BA=5,BN=5", help="Weighted command mix.")
+    parser.add_argument("--remote-ratio", type=float, default=0.0,
+                        help="Share of AD/AW/AB sent to a second local node through the proxy (0..1).")
+    parser.add_argument("--accounts", type=int, default=100, help="Accounts created on each node before the run.")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed, same seed = same command sequence.")
+    parser.add_argument("--port", type=int, default=65525)
+    parser.add_argument("--engine", choices=("threaded", "asyncio"), help="Sets server.engine.")
+    parser.add_argument("--storage-mode", choices=("json", "wal", "snapshot", "mmap"), help="Sets storage.mode.")
+    parser.add_argument("--set", action="append", default=[], metavar="SECTION.KEY=VALUE",
+                        help="Any other node config value, e.g. --set proxy.pool_enabled=false.")
+    parser.add_argument("--out", help="Write the JSON result to this file instead of stdout.")
+    return parser
+
+
+def _overrides(args) -> dict:
+    out: dict = {}
+    items = list(args.set)
+    if args.engine:
+        items.append(f"server.engine={args.engine}")
+    if args.storage_mode:
+        items.append(f"storage.mode={args.storage_mode}")
+    for item in items:
+        key, sep, value = item.partition("=")
+        if not sep or "." not in key:
+            raise BenchError(f"Invalid --set value: {item}")
+        section, name = key.split(".", 1)
+        out.setdefault(section, {})[name] = yaml.safe_load(value)
+    return out
+
+
+def main():
+    args = build_parser().parse_args()
+    try:
+        result = run_benchmark(
+            clients=args.clients,
+            duration_sec=args.duration,
+            mix=parse_mix(args.mix),
+            remote_ratio=args.remote_ratio,
+            accounts=args.accounts,
+            seed=args.seed,
+            port=args.port,
+            node_overrides=_overrides(args),
+        )
+    except BenchError as e:
+        print(f"bench error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    text = json.dumps(result, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
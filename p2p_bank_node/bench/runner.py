@@ -0,0 +1,279 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import yaml
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+COMMANDS = ("AC", "AD", "AW", "AB", "BA", "BN")
+
+
+class BenchError(Exception):
+    pass
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    """'AD=40,AW=20,AB=40' -> {"AD": 40, "AW": 20, "AB": 40}"""
+    mix = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        code, _, weight = part.partition("=")
+        code = code.strip().upper()
+        if code not in COMMANDS:
+            raise BenchError(f"Unknown command in mix: {code}")
+        try:
+            mix[code] = int(weight)
+        except ValueError:
+            raise BenchError(f"Invalid weight for {code}: {weight}")
+    if not mix or sum(mix.values()) <= 0:
+        raise BenchError("Command mix must have a positive total weight.")
+    return mix
+
+
+def _merge(base: dict, extra: dict) -> dict:
+    for k, v in extra.items():
+        if isinstance(v, dict) and isinstance(base.get(k), dict):
+            _merge(base[k], v)
+        else:
+            base[k] = v
+    return base
+
+
+class Node:
+    """One bank node started as a subprocess with its own temp data/log directory."""
+
+    def __init__(self, ip: str, port: int, overrides: dict, workdir: str):
+        self.ip = ip
+        self.port = port
+        self.workdir = workdir
+        self.cfg = _merge({
+            "bank": {"ip": ip, "port": port},
+            "timeouts": {"client_idle_timeout_sec": 60.0, "proxy_timeout_sec": 5.0},
+            "storage": {"data_file": os.path.join(workdir, "bank_state.json"),
+                        "snapshot_dir": os.path.join(workdir, "snapshots")},
+            "logging": {"level": "WARNING", "file": os.path.join(workdir, "bank.log")},
+        }, overrides)
+        self.proc: subprocess.Popen | None = None
+
+    def start(self, wait_sec: float = 15.0) -> None:
+        cfg_path = os.path.join(self.workdir, "config.yaml")
+        with open(cfg_path, "w", encoding="utf-8") as f:
+            yaml.safe_dump(self.cfg, f)
+        self._stderr = open(os.path.join(self.workdir, "stderr.txt"), "w", encoding="utf-8")
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "p2p_bank_node.bank_node", "--config", cfg_path],
+            cwd=REPO_ROOT, stdout=subprocess.DEVNULL, stderr=self._stderr,
+        )
+        deadline = time.monotonic() + wait_sec
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise BenchError(f"Node {self.ip}:{self.port} exited, see {self._stderr.name}")
+            try:
+                socket.create_connection((self.ip, self.port), timeout=0.2).close()
+                return
+            except OSError:
+                time.sleep(0.05)
+        raise BenchError(f"Node {self.ip}:{self.port} did not start in {wait_sec} s.")
+
+    def stop(self) -> None:
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.terminate()
+            try:
+                self.proc.wait(5)
+            except subprocess.TimeoutExpired:
+                self.proc.kill()
+        self._stderr.close()
+
+
+class Client:
+    def __init__(self, ip: str, port: int, timeout_sec: float):
+        self.sock = socket.create_connection((ip, port), timeout=timeout_sec)
+        self.rfile = self.sock.makefile("rb")
+
+    def call(self, line: str) -> str:
+        self.sock.sendall(line.encode("utf-8") + b"\n")
+        resp = self.rfile.readline()
+        if not resp:
+            raise BenchError("Connection closed by node.")
+        return resp.decode("utf-8", errors="replace").strip()
+
+    def close(self) -> None:
+        try:
+            self.rfile.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+
+def _create_accounts(ip: str, port: int, count: int, initial: int) -> list[int]:
+    c = Client(ip, port, 10.0)
+    try:
+        accounts = []
+        for _ in range(count):
+            resp = c.call("AC")
+            if not resp.startswith("AC "):
+                raise BenchError(f"Account setup failed: {resp}")
+            acct = int(resp.split()[1].split("/")[0])
+            if initial:
+                c.call(f"AD {acct}/{ip} {initial}")
+            accounts.append(acct)
+        return accounts
+    finally:
+        c.close()
+
+
+def _percentiles(samples: list[float]) -> dict:
+    if not samples:
+        return {"count": 0}
+    s = sorted(samples)
+
+    def pick(q):
+        return round(s[min(len(s) - 1, int(q * len(s)))], 3)
+
+    return {
+        "count": len(s),
+        "mean_ms": round(sum(s) / len(s), 3),
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "p99_ms": pick(0.99),
+        "max_ms": round(s[-1], 3),
+    }
+
+
+def run_benchmark(clients: int, duration_sec: float, mix: dict[str, int], remote_ratio: float, accounts: int,
+                  seed: int, port: int, node_overrides: dict, timeout_sec: float = 10.0) -> dict:
+    """
+    Starts node A on 127.0.0.1 (and node B on 127.0.0.2 when remote_ratio > 0), drives A
+    with `clients` threads for `duration_sec` and returns the results as a JSON-ready dict.
+    """
+    with tempfile.TemporaryDirectory(prefix="bank_bench_") as tmp:
+        nodes = [Node("127.0.0.1", port, node_overrides, os.path.join(tmp, "a"))]
+        if remote_ratio > 0:
+            nodes.append(Node("127.0.0.2", port, node_overrides, os.path.join(tmp, "b")))
+        for n in nodes:
+            os.makedirs(n.workdir)
+
+        try:
+            for n in nodes:
+                n.start()
+            local_ip = nodes[0].ip
+            local_accts = _create_accounts(local_ip, port, accounts, 1_000_000)
+            remote_accts = []
+            if len(nodes) > 1:
+                remote_accts = _create_accounts(nodes[1].ip, port, accounts, 1_000_000)
+            return _drive(nodes, clients, duration_sec, mix, remote_ratio, local_accts, remote_accts, seed,
+                          port, timeout_sec)
+        finally:
+            for n in nodes:
+                n.stop()
+
+
+def _drive(nodes, clients, duration_sec, mix, remote_ratio, local_accts, remote_accts, seed, port, timeout_sec):
+    codes = list(mix)
+    weights = [mix[c] for c in codes]
+    local_ip = nodes[0].ip
+    remote_ip = nodes[1].ip if len(nodes) > 1 else None
+
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    dropped = [0]  # calls that got no reply at all (counted in errors, but not in latencies)
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients + 1)
+    stop_at = [0.0]
+
+    def worker(i: int):
+        rnd = random.Random(seed + i)
+        lat: dict[str, list[float]] = {}
+        err: dict[str, int] = {}
+        lost = 0
+        c: Client | None = None
+        try:
+            # A worker that cannot connect still has to reach the barrier, it retries in the loop.
+            try:
+                c = Client(local_ip, port, timeout_sec)
+            except OSError:
+                pass
+            start_barrier.wait()
+            while time.perf_counter() < stop_at[0]:
+                code = rnd.choices(codes, weights)[0]
+                label = code
+                if code in ("AD", "AW", "AB"):
+                    if remote_ip and rnd.random() < remote_ratio:
+                        target = f"{rnd.choice(remote_accts)}/{remote_ip}"
+                        label = code + "_proxy"
+                    else:
+                        target = f"{rnd.choice(local_accts)}/{local_ip}"
+                    line = f"{code} {target}" if code == "AB" else f"{code} {target} {rnd.randint(1, 100)}"
+                else:
+                    line = code
+                if c is None:
+                    try:
+                        c = Client(local_ip, port, timeout_sec)
+                    except OSError:
+                        err[label] = err.get(label, 0) + 1
+                        lost += 1
+                        continue
+                t0 = time.perf_counter()
+                try:
+                    resp = c.call(line)
+                except (OSError, BenchError):
+                    err[label] = err.get(label, 0) + 1
+                    lost += 1
+                    c.close()
+                    c = None
+                    continue
+                lat.setdefault(label, []).append((time.perf_counter() - t0) * 1000)
+                if resp.startswith("ER"):
+                    err[label] = err.get(label, 0) + 1
+        finally:
+            if c is not None:
+                c.close()
+            with lock:
+                for k, v in lat.items():
+                    latencies.setdefault(k, []).extend(v)
+                for k, v in err.items():
+                    errors[k] = errors.get(k, 0) + v
+                dropped[0] += lost
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True) for i in range(clients)]
+    for t in threads:
+        t.start()
+    stop_at[0] = time.perf_counter() + duration_sec
+    start_barrier.wait()
+    started = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+
+    all_lat = [v for vs in latencies.values() for v in vs]
+    total_ops = len(all_lat)
+    total_errors = sum(errors.values())
+    attempts = total_ops + dropped[0]
+    return {
+        "params": {
+            "clients": clients,
+            "duration_sec": duration_sec,
+            "mix": {c: mix[c] for c in codes},
+            "remote_ratio": remote_ratio,
+            "accounts_per_node": len(local_accts),
+            "seed": seed,
+            "node_config": nodes[0].cfg,
+        },
+        "elapsed_sec": round(elapsed, 3),
+        "ops": total_ops,
+        "ops_per_sec": round(total_ops / elapsed, 1) if elapsed else 0.0,
+        "errors": total_errors,
+        "error_rate": round(total_errors / attempts, 5) if attempts else 0.0,
+        "latency": _percentiles(all_lat),
+        "commands": {
+            label: {**_percentiles(latencies.get(label, [])), "errors": errors.get(label, 0)}
+            for label in sorted(set(latencies) | set(errors))
+        },
+    }
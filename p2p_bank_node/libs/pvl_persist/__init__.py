@@ -1,3 +1,16 @@
 from .json_store import load_json, save_json_atomic, PersistenceError
+from .oplog import OpLog, read_oplog, DURABILITY_LEVELS
+from .snapshot import save_int_map_atomic, load_int_map
+from .int_table import MappedIntTable
 
-__all__ = ["load_json", "save_json_atomic", "PersistenceError"]
\ No newline at end of file
+__all__ = [
+    "load_json",
+    "save_json_atomic",
+    "PersistenceError",
+    "OpLog",
+    "read_oplog",
+    "DURABILITY_LEVELS",
+    "save_int_map_atomic",
+    "load_int_map",
+    "MappedIntTable",
+]
\ No newline at end of file
@@ -0,0 +1,175 @@
+import mmap
+import os
+import struct
+import threading
+from collections.abc import Callable, Mapping, MutableMapping
+
+from .json_store import PersistenceError
+
+_MAGIC = b"PVLT"
+_VERSION = 1
+# magic, version, key_min, key_max; padded to _HEADER_SIZE so the int64 values stay 8-byte aligned
+_HEADER = struct.Struct("<4sHII")
+_HEADER_SIZE = 64
+
+
+class MappedIntTable(MutableMapping):
+    """
+    int -> int64 mapping over a dense key range, kept in a memory-mapped file:
+
+        header (64 B) | int64 value per key | existence bitmap (1 bit per key)
+
+    Every change is an in-place store into the mapping, the OS writes dirty pages back on its own,
+    flush()/flush_keys() force it (msync). Opening is a plain mmap, nothing is parsed or replayed.
+    A value store is one aligned 8-byte write. Bitmap updates take a lock, one bitmap byte is shared
+    by 8 neighbouring keys.
+
+    A missing file is built complete in a temporary file, filled from seed() when given, and then
+    renamed into place, so a crash during creation never leaves a valid but empty table behind.
+    """
+
+    def __init__(self, path: str, key_min: int, key_max: int,
+                 seed: Callable[[], Mapping[int, int]] | None = None):
+        self.path = path
+        self.key_min = key_min
+        self.key_max = key_max
+        n = key_max - key_min + 1
+        self._values_end = _HEADER_SIZE + n * 8
+        size = self._values_end + (n + 7) // 8
+
+        self.created = not os.path.exists(path)
+        try:
+            if self.created:
+                self._build(size, seed() if seed is not None else {})
+            f = open(path, "r+b")
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size or _HEADER.unpack(header) != (_MAGIC, _VERSION, key_min, key_max):
+                f.close()
+                raise PersistenceError(f"Table {path} has unknown format or key range.")
+            if os.fstat(f.fileno()).st_size != size:
+                f.close()
+                raise PersistenceError(f"Table {path} has wrong size.")
+            with f:
+                self._mm = mmap.mmap(f.fileno(), size)
+        except OSError as e:
+            raise PersistenceError(str(e))
+
+        self._values = memoryview(self._mm)[_HEADER_SIZE:self._values_end].cast("q")
+        self._bitmap = memoryview(self._mm)[self._values_end:]
+        self._bit_lock = threading.Lock()
+        self._count = int.from_bytes(self._bitmap, "little").bit_count()
+
+    def _build(self, size: int, items: Mapping[int, int]) -> None:
+        """Writes the whole table to path.tmp, fsyncs it and renames it to path."""
+        image = bytearray(size)
+        _HEADER.pack_into(image, 0, _MAGIC, _VERSION, self.key_min, self.key_max)
+        values = memoryview(image)[_HEADER_SIZE:self._values_end].cast("q")
+        for key, value in items.items():
+            if not self.key_min <= key <= self.key_max:
+                raise PersistenceError(f"Key {key} is outside the table range {self.key_min}-{self.key_max}.")
+            i = key - self.key_min
+            values[i] = value
+            image[self._values_end + (i >> 3)] |= 1 << (i & 7)
+        values.release()
+
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(image)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        dir_fd = os.open(directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def _index(self, key: int) -> int:
+        i = key - self.key_min
+        if i < 0 or key > self.key_max:
+            raise KeyError(key)
+        return i
+
+    def _has(self, i: int) -> bool:
+        return bool(self._bitmap[i >> 3] & (1 << (i & 7)))
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, int) and self.key_min <= key <= self.key_max and self._has(key - self.key_min)
+
+    def __getitem__(self, key: int) -> int:
+        i = self._index(key)
+        if not self._has(i):
+            raise KeyError(key)
+        return self._values[i]
+
+    def get(self, key, default=None):
+        # One pass that cannot raise, safe next to a concurrent __delitem__ (which clears the bit
+        # before zeroing the value): the value is read first, the bit decides whether it counts.
+        if not isinstance(key, int) or not self.key_min <= key <= self.key_max:
+            return default
+        i = key - self.key_min
+        value = self._values[i]
+        return value if self._has(i) else default
+
+    def __setitem__(self, key: int, value: int) -> None:
+        i = self._index(key)
+        # Value first, then the bit: a reader that sees the bit also sees the value.
+        self._values[i] = value
+        if not self._has(i):
+            with self._bit_lock:
+                if not self._has(i):
+                    self._bitmap[i >> 3] |= 1 << (i & 7)
+                    self._count += 1
+
+    def __delitem__(self, key: int) -> None:
+        i = self._index(key)
+        with self._bit_lock:
+            if not self._has(i):
+                raise KeyError(key)
+            self._bitmap[i >> 3] &= ~(1 << (i & 7)) & 0xFF
+            self._count -= 1
+        self._values[i] = 0
+
+    def __iter__(self):
+        bitmap = bytes(self._bitmap)
+        for byte_index, byte in enumerate(bitmap):
+            if not byte:
+                continue
+            for bit in range(8):
+                if byte & (1 << bit):
+                    yield self.key_min + byte_index * 8 + bit
+
+    def __len__(self) -> int:
+        return self._count
+
+    def flush(self) -> None:
+        try:
+            self._mm.flush()
+        except OSError as e:
+            raise PersistenceError(str(e))
+
+    def flush_keys(self, keys) -> None:
+        """msync only the pages that hold the values and bitmap bits of keys."""
+        pages = set()
+        for key in keys:
+            i = key - self.key_min
+            pages.add((_HEADER_SIZE + i * 8) // mmap.PAGESIZE)
+            pages.add((self._values_end + (i >> 3)) // mmap.PAGESIZE)
+        size = len(self._mm)
+        try:
+            for page in sorted(pages):
+                offset = page * mmap.PAGESIZE
+                self._mm.flush(offset, min(mmap.PAGESIZE, size - offset))
+        except OSError as e:
+            raise PersistenceError(str(e))
+
+    def close(self) -> None:
+        if self._mm.closed:
+            return
+        self.flush()
+        # The views must be released before the mapping can be closed.
+        self._values.release()
+        self._bitmap.release()
+        self._mm.close()
@@ -0,0 +1,163 @@
+import json
+import os
+import threading
+import time
+
+from .json_store import PersistenceError
+
+DURABILITY_LEVELS = ("batch", "interval")
+
+
+def read_oplog(path: str) -> list[dict]:
+    """
+    Reads all complete records of an append-only log (JSON lines).
+    A torn last line (crash during append) is ignored.
+    """
+    if not os.path.exists(path):
+        return []
+    records = []
+    try:
+        with open(path, "rb") as f:
+            for raw in f:
+                if not raw.endswith(b"\n"):
+                    break
+                records.append(json.loads(raw))
+    except (OSError, ValueError) as e:
+        raise PersistenceError(str(e))
+    return records
+
+
+class OpLog:
+    """
+    Append-only operation log with group commit.
+
+    Writers call append() (cheap, only queues the record) and then wait_durable().
+    A single flusher thread writes everything queued so far with one write + one fsync,
+    so concurrent writers share the cost of a disk flush.
+
+    durability:
+    - "batch": wait_durable() blocks until the record is fsynced.
+    - "interval": records are flushed every flush_interval_sec, wait_durable() does not block.
+    """
+
+    def __init__(self, path: str, durability: str = "batch", flush_interval_sec: float = 0.05):
+        if durability not in DURABILITY_LEVELS:
+            raise PersistenceError(f"Unknown durability level: {durability}")
+        self.path = path
+        self.durability = durability
+        self.flush_interval_sec = flush_interval_sec
+
+        d = os.path.dirname(path) or "."
+        try:
+            os.makedirs(d, exist_ok=True)
+            self._f = open(path, "ab")
+        except OSError as e:
+            raise PersistenceError(str(e))
+
+        self._cond = threading.Condition()
+        self._pending: list[bytes] = []
+        self._seq = 0
+        self._durable_seq = 0
+        self._error: Exception | None = None
+        self._closed = False
+        # Size of the current file's content (appended since open, truncate() or rotate()).
+        self.records = 0
+        self.bytes = 0
+
+        self._thread = threading.Thread(target=self._flush_loop, name="pvl-oplog", daemon=True)
+        self._thread.start()
+
+    def append(self, record: dict) -> int:
+        data = json.dumps(record, separators=(",", ":")).encode("utf-8") + b"\n"
+        with self._cond:
+            if self._error is not None:
+                raise PersistenceError(str(self._error))
+            if self._closed:
+                raise PersistenceError("Operation log is closed.")
+            self._pending.append(data)
+            self._seq += 1
+            self.records += 1
+            self.bytes += len(data)
+            self._cond.notify_all()
+            return self._seq
+
+    def wait_durable(self, seq: int) -> None:
+        if self.durability != "batch":
+            return
+        with self._cond:
+            while self._durable_seq < seq and self._error is None:
+                self._cond.wait()
+            if self._durable_seq < seq:
+                raise PersistenceError(str(self._error))
+
+    def truncate(self) -> None:
+        """Drops all records (after they were checkpointed elsewhere)."""
+        with self._cond:
+            while self._durable_seq < self._seq and self._error is None:
+                self._cond.wait()
+            try:
+                self._f.truncate(0)
+                self._f.flush()
+                os.fsync(self._f.fileno())
+            except OSError as e:
+                raise PersistenceError(str(e))
+            self.records = 0
+            self.bytes = 0
+
+    def rotate(self, new_path: str) -> None:
+        """
+        Flushes everything queued so far to the current file and continues in new_path.
+        The caller must make sure no append() runs concurrently.
+        """
+        with self._cond:
+            while self._durable_seq < self._seq and self._error is None:
+                self._cond.wait()
+            if self._error is not None:
+                raise PersistenceError(str(self._error))
+            try:
+                f = open(new_path, "ab")
+            except OSError as e:
+                raise PersistenceError(str(e))
+            self._f.close()
+            self._f = f
+            self.path = new_path
+            self.records = 0
+            self.bytes = 0
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+        self._f.close()
+
+    def _flush_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending and self._closed:
+                    return
+
+            if self.durability == "interval" and not self._closed:
+                # Let records accumulate, one fsync per interval.
+                time.sleep(self.flush_interval_sec)
+
+            with self._cond:
+                batch = self._pending
+                self._pending = []
+                batch_seq = self._seq
+
+            try:
+                self._f.write(b"".join(batch))
+                self._f.flush()
+                os.fsync(self._f.fileno())
+            except OSError as e:
+                with self._cond:
+                    self._error = e
+                    self._cond.notify_all()
+                return
+
+            with self._cond:
+                self._durable_seq = batch_seq
+                self._cond.notify_all()
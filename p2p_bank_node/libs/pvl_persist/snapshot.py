@@ -0,0 +1,59 @@
+import os
+import struct
+import tempfile
+import zlib
+from array import array
+
+from .json_store import PersistenceError
+
+_MAGIC = b"PVLS"
+_VERSION = 1
+# magic, version, count, crc32 of the payload
+_HEADER = struct.Struct("<4sHII")
+
+
+def save_int_map_atomic(path: str, data: dict[int, int]) -> None:
+    """
+    Compact binary dump of an int -> int mapping (keys uint32, values int64).
+    Written to a temp file and renamed, so a reader sees either the old or the new file.
+    """
+    try:
+        keys = array("I", data.keys())
+        values = array("q", data.values())
+        payload = keys.tobytes() + values.tobytes()
+        header = _HEADER.pack(_MAGIC, _VERSION, len(keys), zlib.crc32(payload))
+
+        d = os.path.dirname(path) or "."
+        os.makedirs(d, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(prefix="pvl_", suffix=".bin", dir=d)
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except (OSError, OverflowError) as e:
+        raise PersistenceError(str(e))
+
+
+def load_int_map(path: str) -> dict[int, int]:
+    try:
+        with open(path, "rb") as f:
+            raw = f.read()
+    except OSError as e:
+        raise PersistenceError(str(e))
+
+    if len(raw) < _HEADER.size:
+        raise PersistenceError(f"Snapshot {path} is truncated.")
+    magic, version, count, crc = _HEADER.unpack_from(raw)
+    if magic != _MAGIC or version != _VERSION:
+        raise PersistenceError(f"Snapshot {path} has unknown format.")
+    payload = memoryview(raw)[_HEADER.size:]
+    if len(payload) != count * 12 or zlib.crc32(payload) != crc:
+        raise PersistenceError(f"Snapshot {path} is corrupted.")
+
+    keys = array("I")
+    keys.frombytes(payload[:count * 4])
+    values = array("q")
+    values.frombytes(payload[count * 4:])
+    return dict(zip(keys, values))